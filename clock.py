@@ -0,0 +1,15 @@
+from typing import Callable
+import time
+
+# Time source used by the continuous jobs instead of reading time.time() directly
+# This allows replays and benchmarks to swap in a virtual clock so sessions can be reproduced and fast forwarded
+time_source: Callable[[], float] = time.time
+
+def now() -> float:
+    """Get the current time in seconds from the active time source"""
+    return time_source()
+
+def set_time_source(source: Callable[[], float]):
+    """Replace the time source, passing time.time restores the wall clock"""
+    global time_source
+    time_source = source
@@ -0,0 +1,151 @@
+from talon import cron, Module
+from typing import Callable, List, Tuple
+from .clock import now
+from .output_buffer import output_buffer
+import heapq
+import math
+import threading
+
+# Tick order of the consumers within a single frame
+# Cursor movement happens before scrolling so both land on the same frame boundary
+ORDER_DIRECTIONS = 10
+ORDER_MOMENTUM = 20
+
+class FrameScheduler:
+    """Single 60Hz frame clock that all the continuous jobs subscribe to instead of running their own cron intervals
+
+    Without any consumers the clock is stopped, and only a single wakeup is scheduled for the first deferred callback
+    Noise callbacks and the frame clock run on different threads, so the consumers, deferred callbacks and jobs are guarded by a lock
+    that is never held while a callback runs
+    """
+    job = None
+    interval: str = "16ms"
+    frame_time: float = 0.016
+    wake_job = None
+    wake_ts: float = 0.0
+    consumers: List[Tuple[int, Callable[[], bool]]]
+    
+    # Callbacks that should run once on the first frame after their due time, kept as a heap of ( due, sequence, callback )
+    deferred: List[Tuple[float, int, Callable[[], None]]]
+    deferred_sequence: int = 0
+    
+    # Consumers report whether a tick did any work, so idle ticks can be spotted
+    useful_ticks: int = 0
+    wasted_ticks: int = 0
+    
+    lock: threading.RLock
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.job = None
+        self.wake_job = None
+        self.consumers = []
+        self.deferred = []
+        self.reset_tick_counts()
+        
+    def subscribe(self, callback: Callable[[], bool], order: int = 0):
+        """Tick the callback every frame, consumers with a lower order are ticked first"""
+        with self.lock:
+            if not self.is_subscribed(callback):
+                index = len(self.consumers)
+                while index > 0 and self.consumers[index - 1][0] > order:
+                    index -= 1
+                self.consumers.insert(index, (order, callback))
+                
+            self.schedule()
+            
+    def unsubscribe(self, callback: Callable[[], bool]):
+        """Stop ticking the callback, the frame clock is stopped when no consumers are left"""
+        with self.lock:
+            self.consumers = [consumer for consumer in self.consumers if consumer[1] != callback]
+            self.schedule()
+        
+    def defer(self, delay: float, callback: Callable[[], None]):
+        """Run the callback once on the first frame after the delay in seconds has passed, without blocking the caller"""
+        with self.lock:
+            self.deferred_sequence += 1
+            heapq.heappush(self.deferred, (now() + delay, self.deferred_sequence, callback))
+            self.schedule()
+        
+    def schedule(self):
+        """Run the frame clock while there are consumers, otherwise only wake up when the first deferred callback is due"""
+        with self.lock:
+            if self.consumers:
+                if self.job is None:
+                    self.job = cron.interval(self.interval, self.tick)
+                self.cancel_wake()
+                return
+            
+            if self.job is not None:
+                cron.cancel(self.job)
+                self.job = None
+            
+            if not self.deferred:
+                self.cancel_wake()
+            elif self.wake_job is None or self.deferred[0][0] < self.wake_ts:
+                self.cancel_wake()
+                self.wake_ts = self.deferred[0][0]
+                
+                # Deferred callbacks only run after their due time, so the wakeup always waits at least a millisecond
+                delay_ms = max(1, math.ceil(( self.wake_ts - now() ) * 1000))
+                self.wake_job = cron.after(f"{delay_ms}ms", self.wake)
+            
+    def cancel_wake(self):
+        with self.lock:
+            if self.wake_job is not None:
+                cron.cancel(self.wake_job)
+                self.wake_job = None
+            
+    def wake(self):
+        with self.lock:
+            self.wake_job = None
+        self.tick()
+            
+    def is_subscribed(self, callback: Callable[[], bool]) -> bool:
+        for order, consumer in self.consumers:
+            if consumer == callback:
+                return True
+        return False
+        
+    def tick(self):
+        # All the output of a single frame is flushed at once after every consumer has been ticked
+        output_buffer.begin()
+        try:
+            if self.deferred:
+                self.run_deferred(now())
+        
+            # Iterate over a copy of the current consumers as callbacks may unsubscribe themselves during the tick
+            with self.lock:
+                consumers = self.consumers[:]
+            for order, callback in consumers:
+                if callback():
+                    self.useful_ticks += 1
+                else:
+                    self.wasted_ticks += 1
+        finally:
+            output_buffer.end()
+            
+        self.schedule()
+            
+    def run_deferred(self, ts: float):
+        with self.lock:
+            due_callbacks = []
+            while self.deferred and self.deferred[0][0] <= ts:
+                due_callbacks.append(heapq.heappop(self.deferred)[2])
+        for callback in due_callbacks:
+            callback()
+                
+    def reset_tick_counts(self):
+        self.useful_ticks = 0
+        self.wasted_ticks = 0
+
+frame_scheduler = FrameScheduler()
+
+mod = Module()
+@mod.action_class
+class Actions:
+
+    def frame_scheduler_log_ticks():
+        """Print the amount of useful and wasted frame ticks since the last reset and reset the counters"""
+        print(f"Frame ticks - useful: {frame_scheduler.useful_ticks}, wasted: {frame_scheduler.wasted_ticks}")
+        frame_scheduler.reset_tick_counts()
@@ -1,9 +1,18 @@
 from talon import actions, cron, Context, Module, ctrl
-from typing import Callable, Tuple, TypedDict, Any
+from typing import Callable, Dict, List, Tuple, TypedDict, Any
 from dataclasses import dataclass, asdict
+from collections import deque
+from array import array
 from talon.screen import Screen, main_screen
-import time
+from .clock import now
+from .frame_scheduler import frame_scheduler, ORDER_DIRECTIONS
+from .output_buffer import output_buffer
+from .noise_recorder import noise_recorder
+from .noise_latency import noise_latency
+from .noise_durations import noise_durations, NoiseDurationModel
+from .noise_log import noise_log
 from enum import Enum
+import threading
 
 class HummingEvent(Enum):
     DISCRETE = 0 # Discrete noise - Used when a noise ends within the starting threshold
@@ -29,6 +38,14 @@ class InputThrottler:
     def determine_event(self, ts: float, direction: str, event: HummingEvent) -> HummingEvent:
         """Determine the event for the given direction given the current throttling state"""
         return event
+        
+    def next_due(self, ts: float, direction: str) -> float:
+        """Earliest timestamp at which a repeat of the direction will not be throttled"""
+        return ts
+        
+    def observe_noise(self, ts: float, direction: str, lifecycle: str):
+        """Called with the start and stop of every noise, regardless of the events that are sent to the directions"""
+        pass
 
 class FlatThrottler(InputThrottler):
     """Class used for throttling all directions equally"""
@@ -98,6 +115,13 @@ class FlatThrottler(InputThrottler):
             event = HummingEvent.START            
         
         return event
+        
+    def next_due(self, ts: float, direction: str) -> float:
+        """Earliest timestamp at which a repeat of the direction will not be throttled"""
+        due = self.direction_start + self.starting_throttle
+        if self.throttle > 0:
+            due = max(due, self.last_action + self.throttle)
+        return due
 
 class DirectionVisualizer:
     
@@ -105,51 +129,88 @@ class DirectionVisualizer:
         pass
     
 
-class StickyDirectionVisualizer(DirectionVisualizer):
-    enabled = True
-    direction = "top"
+class HudAbilityQueue:
+    """Queue for the movement ability of the HUD, which only renders real changes and at most once per frame
 
-    def set_directions(self, directions, enabled=True, blink=False):
-        direction = ""        
-        if len(directions) > 0:
-            if "up" in directions:
-               direction += "top"
-            elif "down" in directions:
-               direction += "bottom"
-            if "left" in directions:
-               direction += "left"
-            elif "right" in directions:
-               direction += "right"
+    The HUD is shared by every hummingbird slot, so the last rendered state is kept here rather than in a visualizer
+    """
+    rendered = None
+    pending = None
+    pending_blink = False
+    queued = False
+    
+    # Every requested update that did not result in its own render is suppressed
+    requested_renders: int = 0
+    renders: int = 0
+    
+    def update(self, direction: str, enabled: bool, blink: bool = False):
+        self.requested_renders += 1
+        self.pending = (direction, enabled)
+        self.pending_blink = self.pending_blink or blink
+        if not self.queued and (self.pending != self.rendered or self.pending_blink):
+            self.queued = True
+            frame_scheduler.defer(0.0, self.render)
+            
+    def render(self):
+        self.queued = False
+        if self.pending != self.rendered or self.pending_blink:
+            self.rendered = self.pending
+            self.renders += 1
+            self.visualize(self.pending[0], self.pending[1], self.pending_blink)
+        self.pending_blink = False
+        
+    def suppressed_renders(self) -> int:
+        return self.requested_renders - self.renders
         
-        # Only visualize a change
-        if enabled is not self.enabled or direction is not self.direction:
-            self.enabled = enabled
-            self.direction = direction if direction != "" else self.direction
-            self.visualize(blink)
+    def reset_render_counts(self):
+        self.requested_renders = 0
+        self.renders = 0
 
-    def visualize(self, blink):
-        opacity = "FF" if self.enabled else "77"
+    def visualize(self, direction: str, enabled: bool, blink: bool):
+        opacity = "FF" if enabled else "77"
         colour = "777777" + opacity
         
         activated = 1 if blink else 0
 
-        if self.direction == "top":
+        if direction == "top":
             actions.user.hud_add_ability("movement", "top", colour, 1, activated, 0, -1)
-        elif self.direction == "topleft":
+        elif direction == "topleft":
             actions.user.hud_add_ability("movement", "topleft", colour, 1, activated, 2, 2)
-        elif self.direction == "topright":
+        elif direction == "topright":
             actions.user.hud_add_ability("movement", "topright", colour, 1, activated, -2, 2)
-        elif self.direction == "left":
+        elif direction == "left":
             actions.user.hud_add_ability("movement",  "left", colour, 1, activated, -2, 0)
-        elif self.direction == "right":
+        elif direction == "right":
             actions.user.hud_add_ability("movement", "right", colour, 1, activated, 2, 0)
-        elif self.direction == "bottomleft":
+        elif direction == "bottomleft":
             actions.user.hud_add_ability("movement", "bottomleft", colour, 1, activated, 2, -2)
-        elif self.direction == "bottomright":
+        elif direction == "bottomright":
             actions.user.hud_add_ability("movement", "bottomright", colour, 1, activated, -2, -2)
-        elif self.direction == "bottom":
+        elif direction == "bottom":
             actions.user.hud_add_ability("movement", "bottom", colour, 1, activated, 0, 2)
 
+hud_ability_queue = HudAbilityQueue()
+
+class StickyDirectionVisualizer(DirectionVisualizer):
+    direction = "top"
+
+    def set_directions(self, directions, enabled=True, blink=False):
+        direction = ""        
+        if len(directions) > 0:
+            if "up" in directions:
+               direction += "top"
+            elif "down" in directions:
+               direction += "bottom"
+            if "left" in directions:
+               direction += "left"
+            elif "right" in directions:
+               direction += "right"
+        
+        # Keep showing the last direction when no direction is active
+        if direction != "":
+            self.direction = direction
+        hud_ability_queue.update(self.direction, enabled, blink)
+
 @dataclass
 class DirectionActions:
     up: Callable[[float], None]
@@ -158,6 +219,21 @@ class DirectionActions:
     down: Callable[[float], None]
     throttler: InputThrottler
 
+@dataclass(frozen=True)
+class HummingProfile:
+    """Compiled profile with an immutable dispatch table, owned by a single hummingbird slot along with its throttler state"""
+    name: str
+    action_table: Tuple[Callable[[float, HummingEvent], None], ...]
+    throttler: InputThrottler
+    
+    # Profiles whose actions all ignore REPEAT events have nothing to do on a frame, so their continuous job never ticks
+    repeats: bool = True
+
+def compile_profile(name: str, da: DirectionActions) -> HummingProfile:
+    action_table = (da.up, da.left, da.right, da.down)
+    repeats = not all(getattr(action, "ignores_repeat", False) for action in action_table)
+    return HummingProfile(name, action_table, da.throttler, repeats)
+
 # Only triggers actions that do not have any clean up actions related to them
 def should_trigger_discrete(event):
     return event.value < HummingEvent.STOP.value
@@ -166,160 +242,536 @@ def print_key(key: str):
     return lambda ts, event: print("Pressed key " + key + " on event " + str(event))
 
 def action_key(action):
-    return lambda ts, event: action() if should_trigger_discrete(event) else 1
+    return lambda ts, event: output_buffer.action(action) if should_trigger_discrete(event) else 1
     
 def keypress_key(key):
-    return lambda ts, event: actions.key(key) if should_trigger_discrete(event) else 1
+    return lambda ts, event: output_buffer.key(key) if should_trigger_discrete(event) else 1
 
 def mouse_move_action(x_offset: float, y_offset: float):
-    return lambda ts, event, x_offset=x_offset, y_offset=y_offset: actions.user.mouse_relative_move(x_offset, y_offset) \
+    return lambda ts, event, x_offset=x_offset, y_offset=y_offset: output_buffer.mouse_move(x_offset, y_offset) \
         if should_trigger_discrete(event) else 1
 
-def multiple_releases(key):
-    actions.key(key + ":up")
-    actions.sleep(0.010)
+class CursorVelocity:
+    """Moves the cursor at a speed in pixels per second using the real time between ticks
+    
+    Fractional pixels are accumulated so the speed stays the same regardless of tick jitter or tick rate
+    """
+    speed: float
+    acceleration: float
+    max_speed: float
+    step: float
+    max_frame_time: float
+    
+    def __init__(self, speed=375.0, acceleration=0.0, max_speed=None, step=6.0, max_frame_time=0.25):
+        self.speed = speed
+        self.acceleration = acceleration
+        self.max_speed = speed if max_speed is None else max_speed
+        self.step = step
+        self.max_frame_time = max_frame_time
+        self.clear()
+        
+    def clear(self):
+        self.direction_start = {}
+        self.direction_last = {}
+        self.remainder_x = 0.0
+        self.remainder_y = 0.0
+
+    def speed_at(self, held: float) -> float:
+        """Speed in pixels per second after holding a direction for the given amount of seconds"""
+        return min(self.max_speed, self.speed + self.acceleration * held)
+        
+    def move(self, ts: float, event: HummingEvent, x: int, y: int):
+        direction = (x, y)
+        
+        # Discrete noises nudge the cursor a single step
+        if event == HummingEvent.DISCRETE:
+            output_buffer.mouse_move(x * self.step, y * self.step)
+        elif event == HummingEvent.START:
+            self.direction_start[direction] = ts
+            self.direction_last[direction] = ts
+        elif event == HummingEvent.REPEAT:
+            if direction not in self.direction_last:
+                self.direction_start[direction] = ts
+                self.direction_last[direction] = ts
+                return
+            
+            # Cap the elapsed time so a long stall does not make the cursor jump across the screen
+            elapsed = min(self.max_frame_time, ts - self.direction_last[direction])
+            self.direction_last[direction] = ts
+            if elapsed <= 0:
+                return
+            
+            distance = self.speed_at(ts - self.direction_start[direction]) * elapsed
+            self.remainder_x += x * distance
+            self.remainder_y += y * distance
+            move_x = int(self.remainder_x)
+            move_y = int(self.remainder_y)
+            if move_x != 0 or move_y != 0:
+                self.remainder_x -= move_x
+                self.remainder_y -= move_y
+                output_buffer.mouse_move(move_x, move_y)
+        elif event == HummingEvent.STOP:
+            self.direction_start.pop(direction, None)
+            self.direction_last.pop(direction, None)
+            if len(self.direction_last) == 0:
+                self.remainder_x = 0.0
+                self.remainder_y = 0.0
+
+def mouse_velocity_action(velocity: CursorVelocity, x: int, y: int):
+    return lambda ts, event: velocity.move(ts, event, x, y)
+
+def release_key(key):
     actions.key(key + ":up")
 
+class KeyReleases:
+    """Releases held keys twice to make sure programs that miss the first release do not keep the key held
+
+    The second release is deferred to the frame scheduler so the noise handling never has to sleep
+    Pressing the key again before then drops the pending release, so a quick re-press is not released while the noise is still held
+    """
+    pending: Dict[str, int]
+    sequence: int = 0
+    lock: threading.Lock
+    
+    def __init__(self):
+        self.pending = {}
+        self.sequence = 0
+        self.lock = threading.Lock()
+        
+    def press(self, key: str):
+        with self.lock:
+            self.pending.pop(key, None)
+        actions.key(key + ":down")
+        
+    def release(self, key: str):
+        release_key(key)
+        with self.lock:
+            self.sequence += 1
+            sequence = self.pending[key] = self.sequence
+        frame_scheduler.defer(0.010, lambda: self.release_again(key, sequence))
+        
+    def release_again(self, key: str, sequence: int):
+        with self.lock:
+            if self.pending.get(key) != sequence:
+                return
+            del self.pending[key]
+        release_key(key)
+
+key_releases = KeyReleases()
+
 def keyhold_key(key):
-    return lambda ts, event: actions.key(key + ":down") if event == HummingEvent.START else \
-        multiple_releases(key) if event == HummingEvent.STOP else 1
+    action = lambda ts, event: key_releases.press(key) if event == HummingEvent.START else \
+        key_releases.release(key) if event == HummingEvent.STOP else 1
+    action.ignores_repeat = True
+    return action
+
+# Directions are stored as bits inside a direction mask, the index of the bit is also the index in the action table
+DIRECTIONS = ("up", "left", "right", "down")
+DIRECTION_INDEX = {"up": 0, "left": 1, "right": 2, "down": 3}
+OPPOSITE_INDEX = (3, 2, 1, 0)
+ALL_DIRECTIONS_MASK = 0b1111
+
+# Precomputed direction indices and names for every possible mask so iterating them does not need any bit twiddling
+DIRECTIONS_IN_MASK = tuple(tuple(index for index in range(4) if mask & (1 << index)) for mask in range(16))
+DIRECTION_NAMES_IN_MASK = tuple(tuple(DIRECTIONS[index] for index in indices) for indices in DIRECTIONS_IN_MASK)
+
+# Directions that should be cleared when a direction is activated, indexed by the activated direction
+EXCLUSION_MASKS = {
+    HummingExclusionStrategy.MONO: tuple(ALL_DIRECTIONS_MASK & ~(1 << index) for index in range(4)),
+    HummingExclusionStrategy.OPPOSITE: tuple(1 << OPPOSITE_INDEX[index] for index in range(4)),
+}
+
+class DirectionalThrottler(InputThrottler):
+    """Class used for throttling every direction on its own timeline, so diagonals get the full rate on both axes
+
+    Uses the same rules as the FlatThrottler, but the timestamps are kept per direction in arrays indexed by direction
+    """
+    throttle: float
+    starting_throttle: float
+    last_action: array
+
+    # Used for grace periods of discrete vs continuous
+    direction_start: array
+    direction_stop: array
+    last_duration: array
+
+    # Whether the delayed start has been sent for the direction
+    started: array
+
+    def __init__(self, throttle=0.000, starting_throttle=None):
+        self.throttle = throttle
+        self.starting_throttle = 0.0 if starting_throttle is None else starting_throttle
+        self.last_action = array('d', [0.0] * len(DIRECTIONS))
+        self.direction_start = array('d', [0.0] * len(DIRECTIONS))
+        self.direction_stop = array('d', [0.0] * len(DIRECTIONS))
+        self.last_duration = array('d', [0.0] * len(DIRECTIONS))
+        self.started = array('b', [0] * len(DIRECTIONS))
+
+    def clear(self):
+        for index in range(len(DIRECTIONS)):
+            self.last_action[index] = 0.0
+            self.direction_start[index] = 0.0
+            self.direction_stop[index] = 0.0
+            self.last_duration[index] = 0.0
+            self.started[index] = 0
+
+    def determine_event(self, ts: float, direction: str, event: HummingEvent) -> HummingEvent:
+        """Determine the event for the given direction given the throttling state of that direction"""
+        index = DIRECTION_INDEX[direction]
+
+        if (event == HummingEvent.START):
+            if self.last_duration[index] < self.starting_throttle or ts - self.direction_stop[index] > self.starting_throttle:
+                self.direction_start[index] = ts
+                self.last_action[index] = ts
+
+                if self.starting_throttle > 0:
+                    return HummingEvent.THROTTLED
+                else:
+                    self.started[index] = 1
+                    return event
+
+            if self.starting_throttle > 0:
+                return HummingEvent.THROTTLED
+
+        elif (event == HummingEvent.STOP):
+            self.started[index] = 0
+            self.direction_stop[index] = ts
+            self.last_duration[index] = ts - self.direction_start[index]
+
+            if self.starting_throttle > 0.0:
+                return HummingEvent.STOP if ts - self.direction_start[index] > self.starting_throttle else HummingEvent.DISCRETE
+            else:
+                return event
+
+        if (self.last_action[index] + self.throttle) > ts and self.throttle > 0 or (ts - self.direction_start[index]) < self.starting_throttle:
+            return HummingEvent.THROTTLED
+
+        self.last_action[index] = ts
+
+        # The actual start is delayed by the starting throttle, so the first repeat after it becomes the start event
+        if not self.started[index]:
+            self.started[index] = 1
+            event = HummingEvent.START
+
+        return event
+
+    def next_due(self, ts: float, direction: str) -> float:
+        """Earliest timestamp at which a repeat of the direction will not be throttled"""
+        index = DIRECTION_INDEX[direction]
+        due = self.direction_start[index] + self.starting_throttle
+        if self.throttle > 0:
+            due = max(due, self.last_action[index] + self.throttle)
+        return due
+
+class AdaptiveThrottler(InputThrottler):
+    """Wraps a throttler and lowers its starting throttle to what the learned noise durations of the user allow
+
+    The configured starting throttle is used as the upper bound, so an unpracticed user gets the regular behaviour
+    """
+    throttler: InputThrottler
+    default_starting_throttle: float
+    noise_starts: array
+
+    def __init__(self, throttler: InputThrottler, durations: NoiseDurationModel = noise_durations):
+        self.throttler = throttler
+        self.durations = durations
+        self.default_starting_throttle = throttler.starting_throttle
+        self.noise_starts = array('d', [0.0] * len(DIRECTIONS))
+        self.adapt()
+
+    def adapt(self):
+        self.throttler.starting_throttle = self.durations.threshold(self.default_starting_throttle)
+
+    def clear(self):
+        self.throttler.clear()
+        self.adapt()
+
+    def determine_event(self, ts: float, direction: str, event: HummingEvent) -> HummingEvent:
+        return self.throttler.determine_event(ts, direction, event)
+        
+    def observe_noise(self, ts: float, direction: str, lifecycle: str):
+        """Learn the duration of every noise from its own start and stop
+        
+        The START and STOP events of the directions are not used, as continuous mode, pausing and clearing also send them
+        """
+        index = DIRECTION_INDEX[direction]
+        if lifecycle == "start":
+            self.noise_starts[index] = ts
+        elif lifecycle == "stop" and self.noise_starts[index] > 0.0:
+            self.durations.observe(ts - self.noise_starts[index])
+            self.noise_starts[index] = 0.0
+            self.adapt()
+
+    def next_due(self, ts: float, direction: str) -> float:
+        return self.throttler.next_due(ts, direction)
 
 class HummingBird:
     paused = False
-    job = None
-    directions = []
+    continuous = False
+    direction_mask = 0
     visualizer = None
     
-    direction_actions = None
+    profiles = None
+    profile: HummingProfile = None
+    action_table = None
+    throttler: InputThrottler = None
     exclusion_strategy = HummingExclusionStrategy.OPPOSITE
+    exclusion_masks = None
     
-    def __init__(self, visualizer: DirectionVisualizer):
+    # Noise callbacks and the frame clock run on different threads, so every state change is queued
+    # Whichever thread holds the owner lock applies the queued changes, the others never wait for it
+    changes = None
+    owner = None
+    
+    # The continuous jobs of every slot in a charm are ticked together by a single frame consumer
+    charm = None
+    slot_index: int = 0
+    
+    def __init__(self, visualizer: DirectionVisualizer, profiles = None, charm = None):
         self.visualizer = visualizer
-        self.direction_actions = DirectionActions(
+        self.direction_mask = 0
+        self.changes = deque()
+        self.owner = threading.Lock()
+        self.charm = charm_of_hummingbirds if charm is None else charm
+        self.slot_index = self.charm.register(self)
+        self.set_exclusion_strategy(self.exclusion_strategy)
+        
+        # Every slot compiles its own profiles up front, so switching profiles is only a matter of swapping references
+        self.profiles = compile_profiles() if profiles is None else profiles
+        self.set_direction_actions(DirectionActions(
             print_key("up"),
             print_key("left"),
             print_key("right"),
             print_key("down"),
             FlatThrottler(0.0, 0.0)            
-        )
+        ))
+        
+    @property
+    def directions(self):
+        return DIRECTION_NAMES_IN_MASK[self.direction_mask]
         
     def set_visualizer(self, visualizer: DirectionVisualizer):
         self.visualizer = visualizer
             
-    def set_direction_actions(self, da: DirectionActions):
-        self.direction_actions = da
+    def set_direction_actions(self, da: DirectionActions, profile: str = ""):
+        self.use_profile(compile_profile(profile, da))
+        
+    def submit(self, change: Callable, *args):
+        """Queue a state change and apply it right away, unless another thread currently owns the state"""
+        self.changes.append((change, args))
+        self.drain()
+        
+    def drain(self):
+        # A change can be queued after the owner finished draining but before it released the lock, so check again after releasing
+        while self.changes:
+            if not self.owner.acquire(blocking=False):
+                return
+            try:
+                self.apply_changes()
+            finally:
+                self.owner.release()
+                
+    def apply_changes(self):
+        changes = self.changes
+        while changes:
+            change, args = changes.popleft()
+            change(*args)
+        
+    def set_profile(self, name: str):
+        """Switch to one of the compiled profiles of this slot, falling back to arrows for unknown profiles"""
+        self.submit(self.apply_profile, name)
+        
+    def apply_profile(self, name: str):
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = self.profiles["arrows"]
+        if profile is not self.profile:
+            self.use_profile(profile)
+            self.resume_continuous_job()
+            
+    def use_profile(self, profile: HummingProfile):
+        self.profile = profile
+        self.action_table = profile.action_table
+        self.throttler = profile.throttler
+        self.throttler.clear()
+        
+    def set_exclusion_strategy(self, strategy: HummingExclusionStrategy):
+        self.exclusion_strategy = strategy
+        self.exclusion_masks = EXCLUSION_MASKS[strategy]
 
     def get_action_by_direction(self, direction):
-        if direction == "up":
-            return self.direction_actions.up
-        elif direction == "left":
-            return self.direction_actions.left
-        elif direction == "right":
-            return self.direction_actions.right
-        elif direction == "down":
-            return self.direction_actions.down
+        return self.action_table[DIRECTION_INDEX[direction]]
     
     def get_action_by_opposite_direction(self, direction):
-        opposite_direction = get_opposite_direction(direction)
-        return get_action_by_direction(opposite_direction)
+        return self.action_table[OPPOSITE_INDEX[DIRECTION_INDEX[direction]]]
             
     def get_opposite_direction(self, direction):
-        if direction == "up":
-            return "down"
-        elif direction == "left":
-            return "right"
-        elif direction == "right":
-            return "left"
-        elif direction == "down":
-            return "up"    
+        return DIRECTIONS[OPPOSITE_INDEX[DIRECTION_INDEX[direction]]]
         
     # Continuous action triggers
     def start_continuous_job(self):
-        ts = time.time()    
+        self.submit(self.apply_start_continuous_job)
+        
+    def apply_start_continuous_job(self):
+        ts = now()    
         if self.paused:
             self.update_directions(ts, HummingEvent.START)
             self.paused = False
             
-        if not self.job:
-            self.job = cron.interval("16ms", self.tick_directions)
+        self.continuous = True
+        self.resume_continuous_job()
+        
+    def resume_continuous_job(self):
+        """Resume ticking the directions if the continuous job has work to do"""
+        if self.continuous and not self.paused and self.direction_mask != 0 and self.profile.repeats:
+            self.charm.subscribe(self)
+
+    def wake_continuous_job(self):
+        """Resume ticking from the frame clock once the throttler allows an action again"""
+        self.submit(self.resume_continuous_job)
 
     def pause_continuous_job(self):
-        ts = time.time()
-        if self.job:
+        self.submit(self.apply_pause_continuous_job)
+        
+    def apply_pause_continuous_job(self):
+        ts = now()
+        if self.continuous:
             self.paused = True
             self.update_directions(ts, HummingEvent.STOP)
+            self.charm.unsubscribe(self)
             
     def end_continuous_job(self):
-        ts = time.time()        
-        if self.job:
+        self.submit(self.apply_end_continuous_job)
+        
+    def apply_end_continuous_job(self):
+        ts = now()        
+        if self.continuous:
             if not self.paused:
                 self.update_directions(ts, HummingEvent.STOP)        
             
             self.paused = False
-            cron.cancel(self.job)
-            self.job = None
+            self.continuous = False
+            self.charm.unsubscribe(self)
             
-    def tick_directions(self):
-        ts = time.time()
-        if not self.paused:
-            self.update_directions(ts, HummingEvent.REPEAT)
+    def tick_directions(self) -> bool:
+        # Skip the frame while a noise callback owns the state, the changes it applies are picked up on the next frame
+        if not self.owner.acquire(blocking=False):
+            return False
+        try:
+            self.apply_changes()
+            ticked = self.apply_tick()
+        finally:
+            self.owner.release()
+        self.drain()
+        return ticked
+        
+    def apply_tick(self) -> bool:
+        # Suspend ticking when there is nothing to move, or when the profile does nothing on a repeat
+        # The job is resumed as soon as a direction is added or the continuous job is started again
+        if self.paused or self.direction_mask == 0 or not self.profile.repeats:
+            self.charm.unsubscribe(self)
+            return False
+        
+        ts = now()
+        dispatched = self.update_directions(ts, HummingEvent.REPEAT)
+        
+        # Sleep when the throttler will not allow any action within the next frame
+        # Deferred callbacks run before the frame consumers, so resuming ticks the directions on the same frame
+        due = self.next_due(ts)
+        if due - ts > frame_scheduler.frame_time:
+            self.charm.unsubscribe(self)
+            frame_scheduler.defer(due - ts, self.wake_continuous_job)
+        return dispatched > 0
+        
+    def next_due(self, ts: float) -> float:
+        """Earliest timestamp at which one of the current directions will not be throttled"""
+        throttler = self.throttler
+        return min([throttler.next_due(ts, DIRECTIONS[index]) for index in DIRECTIONS_IN_MASK[self.direction_mask]])
 
     # Update all the current directions with the given event
-    def update_directions(self, ts, event: HummingEvent):
-        for direction in self.directions:
-            new_event = self.direction_actions.throttler.determine_event(ts, direction, event)
-            self.get_action_by_direction(direction)(ts, new_event)
+    # Returns the amount of directions that were not throttled
+    def update_directions(self, ts, event: HummingEvent) -> int:
+        dispatched = 0
+        throttler = self.throttler
+        action_table = self.action_table
+        output_buffer.begin()
+        try:
+            for index in DIRECTIONS_IN_MASK[self.direction_mask]:
+                new_event = throttler.determine_event(ts, DIRECTIONS[index], event)
+                action_table[index](ts, new_event)
+                if new_event != HummingEvent.THROTTLED:
+                    dispatched += 1
+        finally:
+            output_buffer.end()
+        return dispatched
             
     def activate_direction(self, new_direction, ts, lifecycle):
-        self.exclude_directions(new_direction, ts)
+        self.submit(self.apply_direction, new_direction, ts, lifecycle)
         
-        if lifecycle == "start":
-            self.add_direction(new_direction, ts)
-        elif lifecycle == "repeat" and not self.job:
-            self.repeat_direction(new_direction, ts)
-        elif lifecycle == "stop" and not self.job:
-            self.remove_direction(new_direction, ts)
-        
-    def add_direction(self, direction, ts):
-        if direction not in self.directions:
-            event = self.direction_actions.throttler.determine_event(ts, direction, HummingEvent.START)
-            self.get_action_by_direction(direction)(ts, event)
-            self.directions.append(direction)
-            self.visualizer.set_directions(self.directions, event == HummingEvent.START)
+    def apply_direction(self, new_direction, ts, lifecycle):
+        index = DIRECTION_INDEX[new_direction]
+        output_buffer.begin()
+        try:
+            self.exclude_directions(index, ts)
             
-    def repeat_direction(self, direction, ts):
-        if direction in self.directions:
-            event = self.direction_actions.throttler.determine_event(ts, direction, HummingEvent.REPEAT)
-            self.get_action_by_direction(direction)(ts, event)
+            if lifecycle == "start":
+                self.add_direction(index, ts)
+            elif lifecycle == "repeat" and not self.continuous:
+                self.repeat_direction(index, ts)
+            elif lifecycle == "stop" and not self.continuous:
+                self.remove_direction(index, ts)
+            self.throttler.observe_noise(ts, new_direction, lifecycle)
+        finally:
+            output_buffer.end()
+        
+    def add_direction(self, index: int, ts):
+        bit = 1 << index
+        if not self.direction_mask & bit:
+            event = self.throttler.determine_event(ts, DIRECTIONS[index], HummingEvent.START)
+            self.action_table[index](ts, event)
+            if noise_latency.enabled and event != HummingEvent.THROTTLED:
+                noise_latency.record("hummingbird2_dispatch", self.profile.name, ts)
+            self.direction_mask |= bit
+            self.visualizer.set_directions(DIRECTION_NAMES_IN_MASK[self.direction_mask], event == HummingEvent.START)
+            self.resume_continuous_job()
+            
+    def repeat_direction(self, index: int, ts):
+        if self.direction_mask & (1 << index):
+            event = self.throttler.determine_event(ts, DIRECTIONS[index], HummingEvent.REPEAT)
+            self.action_table[index](ts, event)
+            if noise_latency.enabled and event != HummingEvent.THROTTLED:
+                noise_latency.record("hummingbird2_dispatch", self.profile.name, ts)
             if event == HummingEvent.REPEAT:
-                self.visualizer.set_directions(self.directions)
+                self.visualizer.set_directions(DIRECTION_NAMES_IN_MASK[self.direction_mask])
             
-    def remove_direction(self, direction, ts):
-        if direction in self.directions:
-            event = self.direction_actions.throttler.determine_event(ts, direction, HummingEvent.STOP)        
-            self.get_action_by_direction(direction)(ts, event)            
-            self.directions.remove(direction)
-            self.visualizer.set_directions(self.directions, False, event != HummingEvent.STOP)
-
-    def exclude_directions(self, direction: str, ts):
-        directions_to_clear = []
-        if self.exclusion_strategy == HummingExclusionStrategy.MONO:
-            directions_to_clear = [x for x in self.directions if x != direction]
-        elif self.exclusion_strategy == HummingExclusionStrategy.OPPOSITE:
-            directions_to_clear = [x for x in self.directions if x == self.get_opposite_direction(direction)]
-        
-        for excluded_direction in directions_to_clear:
-            self.get_action_by_direction(excluded_direction)(ts, HummingEvent.STOP)
-            self.directions.remove(excluded_direction)
+    def remove_direction(self, index: int, ts):
+        bit = 1 << index
+        if self.direction_mask & bit:
+            event = self.throttler.determine_event(ts, DIRECTIONS[index], HummingEvent.STOP)        
+            self.action_table[index](ts, event)            
+            if noise_latency.enabled and event != HummingEvent.THROTTLED:
+                noise_latency.record("hummingbird2_dispatch", self.profile.name, ts)
+            self.direction_mask &= ~bit
+            self.visualizer.set_directions(DIRECTION_NAMES_IN_MASK[self.direction_mask], False, event != HummingEvent.STOP)
+
+    def exclude_directions(self, index: int, ts):
+        excluded_mask = self.direction_mask & self.exclusion_masks[index]
+        if excluded_mask:
+            for excluded_index in DIRECTIONS_IN_MASK[excluded_mask]:
+                self.action_table[excluded_index](ts, HummingEvent.STOP)
+            self.direction_mask &= ~excluded_mask
 
     def clear_directions(self, directions):
-        ts = time.time()
+        self.submit(self.apply_clear_directions, directions)
+        
+    def apply_clear_directions(self, directions):
+        ts = now()
         
         if directions == "all":
-            directions = ["up", "left", "right", "down"]
+            directions = DIRECTIONS
         for direction in directions:
-            self.remove_direction(direction, ts)
-        self.visualizer.set_directions(self.directions)
+            self.remove_direction(DIRECTION_INDEX[direction], ts)
+        self.visualizer.set_directions(DIRECTION_NAMES_IN_MASK[self.direction_mask])
 
     # Direction actions
     def up(self, ts: float, lifecycle: str):
@@ -335,82 +787,152 @@ class HummingBird:
         self.activate_direction("down", ts, lifecycle)
             
     def forward(self, ts: float):
-        if len(self.directions) > 0:
-            for direction in self.directions:
-                event = self.direction_actions.throttler.determine_event(ts, direction, HummingEvent.REPEAT)
-                self.get_action_by_direction(direction)(ts, event)
+        self.submit(self.apply_forward, ts)
+        
+    def apply_forward(self, ts: float):
+        for index in DIRECTIONS_IN_MASK[self.direction_mask]:
+            event = self.throttler.determine_event(ts, DIRECTIONS[index], HummingEvent.REPEAT)
+            self.action_table[index](ts, event)
             
     def backward(self, ts: float):
-        if len(self.current_directions) > 0:
-            for direction in self.current_directions:
-                event = self.direction_actions.throttler.determine_event(ts, direction, HummingEvent.REPEAT)            
-                self.get_action_by_opposite_direction(direction)(ts, event)
+        self.submit(self.apply_backward, ts)
+        
+    def apply_backward(self, ts: float):
+        for index in DIRECTIONS_IN_MASK[self.direction_mask]:
+            event = self.throttler.determine_event(ts, DIRECTIONS[index], HummingEvent.REPEAT)            
+            self.action_table[OPPOSITE_INDEX[index]](ts, event)
+
+class HummingbirdCharm:
+    """Every hummingbird slot, with a single frame consumer that ticks all the slots whose continuous job has work to do
+
+    Slots are created on first use, the ticking slots are kept by slot index in the order they started ticking
+    Slots start and stop ticking from both the noise callbacks and the frame clock, so the ticking slots are guarded by a lock
+    """
+    slots: Dict[str, HummingBird]
+    ticking: Dict[int, HummingBird]
+    slot_count: int = 0
+    lock: threading.Lock
+    
+    def __init__(self):
+        self.slots = {}
+        self.ticking = {}
+        self.slot_count = 0
+        self.lock = threading.Lock()
+        
+    def register(self, hummingbird: HummingBird) -> int:
+        with self.lock:
+            self.slot_count += 1
+            return self.slot_count - 1
+        
+    def get(self, slot: str) -> HummingBird:
+        hummingbird = self.slots.get(slot)
+        if hummingbird is None:
+            hummingbird = HummingBird(DirectionVisualizer(), charm=self)
+            hummingbird = self.slots.setdefault(slot, hummingbird)
+        return hummingbird
+        
+    def subscribe(self, hummingbird: HummingBird):
+        with self.lock:
+            if hummingbird.slot_index not in self.ticking:
+                self.ticking[hummingbird.slot_index] = hummingbird
+                frame_scheduler.subscribe(self.tick, ORDER_DIRECTIONS)
+            
+    def unsubscribe(self, hummingbird: HummingBird):
+        with self.lock:
+            if self.ticking.pop(hummingbird.slot_index, None) is not None and not self.ticking:
+                frame_scheduler.unsubscribe(self.tick)
+                
+    def is_ticking(self, hummingbird: HummingBird) -> bool:
+        return hummingbird.slot_index in self.ticking
+        
+    def tick(self) -> bool:
+        # Slots can stop ticking themselves during the pass
+        useful = False
+        with self.lock:
+            ticking = list(self.ticking.values())
+        for hummingbird in ticking:
+            if hummingbird.tick_directions():
+                useful = True
+        return useful
+
+def velocity_direction_actions(velocity: CursorVelocity, throttler: InputThrottler) -> DirectionActions:
+    return DirectionActions(
+        mouse_velocity_action(velocity, 0, -1),
+        mouse_velocity_action(velocity, -1, 0),
+        mouse_velocity_action(velocity, 1, 0),
+        mouse_velocity_action(velocity, 0, 1),
+        throttler
+    )
 
-hummingbird_directions = {
-    "arrows": DirectionActions(
+# Profiles are created per hummingbird slot so no two slots share throttler or cursor state
+hummingbird_profiles = {
+    "arrows": lambda: DirectionActions(
         keypress_key("up"),
         keypress_key("left"),
         keypress_key("right"),
         keypress_key("down"),
-        FlatThrottler(0.1, 0.3),
+        AdaptiveThrottler(FlatThrottler(0.1, 0.3)),
     ),
-	"arrows_word": DirectionActions(
+	"arrows_word": lambda: DirectionActions(
         keypress_key("up"),
         action_key(actions.edit.word_left),
         action_key(actions.edit.word_right),
         keypress_key("down"),
-        FlatThrottler(0.1, 0.3)
+        AdaptiveThrottler(FlatThrottler(0.1, 0.3))
     ),
-	"select": DirectionActions(
+	"select": lambda: DirectionActions(
         action_key(actions.edit.extend_up),
         action_key(actions.edit.extend_left),
         action_key(actions.edit.extend_right),
         action_key(actions.edit.extend_down),
-        FlatThrottler(0.1, 0.3)
+        AdaptiveThrottler(FlatThrottler(0.1, 0.3))
     ),
-	"select_word": DirectionActions(
+	"select_word": lambda: DirectionActions(
         action_key(actions.edit.extend_up),
         action_key(actions.edit.extend_word_left),
         action_key(actions.edit.extend_word_right),
         action_key(actions.edit.extend_down),
-        FlatThrottler(0.1, 0.3)
+        AdaptiveThrottler(FlatThrottler(0.1, 0.3))
     ),    
-    "cursor": DirectionActions(
+    "cursor": lambda: DirectionActions(
         mouse_move_action(0, -6),
         mouse_move_action(-6, 0),
         mouse_move_action(6, 0),
         mouse_move_action(0, 6),
-		FlatThrottler(0.001, 0.2),
+		AdaptiveThrottler(DirectionalThrottler(0.001, 0.2)),
     ),
-    "jira": DirectionActions(
+    
+    # Starts at the speed of the fixed cursor profile and speeds up while a direction is held
+    "cursor_velocity": lambda: velocity_direction_actions(CursorVelocity(375.0, 750.0, 1500.0), AdaptiveThrottler(DirectionalThrottler(0.0, 0.2))),
+    "jira": lambda: DirectionActions(
         keypress_key("k"),
         keypress_key("p"),
         keypress_key("n"),
         keypress_key("j"),
-        FlatThrottler(0.1, 0.3)
+        AdaptiveThrottler(FlatThrottler(0.1, 0.3))
     ),
-    "wasd": DirectionActions(
+    "wasd": lambda: DirectionActions(
         keyhold_key("w"),
         keyhold_key("a"),
         keyhold_key("d"),
         keyhold_key("s"),
         FlatThrottler(0.0, 0.0),
     ),
-    "ijkl": DirectionActions(
+    "ijkl": lambda: DirectionActions(
         keyhold_key("k"),
         keyhold_key("j"),
         keyhold_key("l"),
         keyhold_key("i"),
         FlatThrottler(0.0, 0.0),
     ),
-    "menu": DirectionActions(
+    "menu": lambda: DirectionActions(
         keypress_key("up"),
         keypress_key("left"),
         keypress_key("right"),
         keypress_key("down"),
-        FlatThrottler(0.05, 0.2)
+        AdaptiveThrottler(FlatThrottler(0.05, 0.2))
     ),    
-    "log": DirectionActions(
+    "log": lambda: DirectionActions(
         print_key("up"),
         print_key("left"),
         print_key("right"),
@@ -419,74 +941,94 @@ hummingbird_directions = {
     )
 }
 
+def compile_profiles():
+    return {name: compile_profile(name, create_actions()) for name, create_actions in hummingbird_profiles.items()}
+
 ctx = Context()
 mod = Module()
 mod.tag("humming_bird", desc="Tag whether or not humming bird should be used")
 mod.tag("humming_bird_overrides", desc="Tag to override knausj commands to interlace humming bird overrides in them")
 
-charm_of_hummingbirds = {
-    'primary': HummingBird(StickyDirectionVisualizer()),
-    'secondary': HummingBird(DirectionVisualizer())
-}
+charm_of_hummingbirds = HummingbirdCharm()
+charm_of_hummingbirds.get("primary").set_visualizer(StickyDirectionVisualizer())
+charm_of_hummingbirds.get("secondary")
 current_hummingbird_slot = "primary"
 
 def get_hummingbird_by_slot( slot: str = "" ):
-    global charm_of_hummingbirds
+    """Get the hummingbird of the slot, creating it when it is used for the first time"""
     if slot == "":
         global current_hummingbird_slot
         slot = current_hummingbird_slot
-    return charm_of_hummingbirds[slot]
+    return charm_of_hummingbirds.get(slot)
 
 @mod.action_class
 class Actions:
                 
     def hummingbird2_up(ts: float, lifecycle: str = "stop", slot: str = "" ):
         """Activate the action related to the up direction of the humming bird"""
+        noise_recorder.record("hummingbird2_up", ts, lifecycle, slot)
         hb = get_hummingbird_by_slot(slot)
+        if noise_latency.enabled:
+            noise_latency.record("hummingbird2_up", hb.profile.name, ts)
         hb.up(ts, lifecycle)
                 
     def hummingbird2_left(ts: float, lifecycle: str = "stop", slot: str = ""):
         """Activate the action related to the left direction of the humming bird"""
+        noise_recorder.record("hummingbird2_left", ts, lifecycle, slot)
         hb = get_hummingbird_by_slot(slot)
+        if noise_latency.enabled:
+            noise_latency.record("hummingbird2_left", hb.profile.name, ts)
         hb.left(ts, lifecycle)
                 
     def hummingbird2_right(ts: float, lifecycle: str = "stop", slot: str = ""):
         """Activate the action related to the right direction of the humming bird"""
+        noise_recorder.record("hummingbird2_right", ts, lifecycle, slot)
         hb = get_hummingbird_by_slot(slot)
+        if noise_latency.enabled:
+            noise_latency.record("hummingbird2_right", hb.profile.name, ts)
         hb.right(ts, lifecycle)
         
     def hummingbird2_down(ts: float, lifecycle: str = "stop", slot: str = ""):
         """Activate the action related to the down direction of the humming bird"""
+        noise_recorder.record("hummingbird2_down", ts, lifecycle, slot)
         hb = get_hummingbird_by_slot(slot)
+        if noise_latency.enabled:
+            noise_latency.record("hummingbird2_down", hb.profile.name, ts)
         hb.down(ts, lifecycle)
         
     def hummingbird2_forward(ts: float, slot: str = ""):
         """Repeats the current directions, or repeats the last command"""
+        noise_recorder.record("hummingbird2_forward", ts, slot)
         hb = get_hummingbird_by_slot(slot)
         hb.forward(ts)
         
     def hummingbird2_backward(ts: float, slot: str = ""):
         """Reverses the current directions, or undoes the last edit"""
+        noise_recorder.record("hummingbird2_backward", ts, slot)
         hb = get_hummingbird_by_slot(slot)
         hb.backward(ts)
         
     def hummingbird2_continuous(slot: str = ""):
         """Starts a continuous job that triggers the directions at 60Hz"""
+        noise_recorder.record("hummingbird2_continuous", slot)
         hb = get_hummingbird_by_slot(slot)
         hb.start_continuous_job()
                 
     def hummingbird2_pause(slot: str = ""):
         """Pauses the continuous job, but does not clear the directions"""
+        noise_recorder.record("hummingbird2_pause", slot)
         hb = get_hummingbird_by_slot(slot)
         return hb.pause_continuous_job()
         
     def hummingbird2_stop(slot: str = ""):
         """Ends the continuous job"""
+        noise_recorder.record("hummingbird2_stop", slot)
         hb = get_hummingbird_by_slot(slot)
         hb.end_continuous_job()
 
     def hummingbird2_clear(directions: str = "all", slot: str = ""):
         """Clears all or some of the current directions"""
+        noise_recorder.record("hummingbird2_clear", directions, slot)
         hb = get_hummingbird_by_slot(slot)
         clear_directions = directions
         if directions == "horizontal":
@@ -497,12 +1039,13 @@ class Actions:
         
     def hummingbird2_set(type: str, slot: str = ""):
         """Sets the hummingbird control type"""        
-        global hummingbird_directions
+        noise_recorder.record("hummingbird2_set", type, slot)
         hb = get_hummingbird_by_slot(slot)        
-        hb.set_direction_actions(hummingbird_directions["arrows"] if type not in hummingbird_directions else hummingbird_directions[type])
+        hb.set_profile(type)
         
     def hummingbird2_set_current_slot(slot: str):
-        """Sets the current hummingbird instance and unlinks the visualizer"""        
+        """Sets the current hummingbird instance, creating it on first use, and unlinks the visualizer"""
+        noise_recorder.record("hummingbird2_set_current_slot", slot)
         global current_hummingbird_slot
         old_hb = get_hummingbird_by_slot(current_hummingbird_slot)
         old_hb.set_visualizer(DirectionVisualizer())
@@ -511,6 +1054,11 @@ class Actions:
         new_hb = get_hummingbird_by_slot(current_hummingbird_slot)
         new_hb.set_visualizer(StickyDirectionVisualizer())
         
+    def hummingbird2_log_hud_renders():
+        """Print the amount of HUD renders and the amount of suppressed renders since the last reset and reset the counters"""
+        print(f"HUD renders: {hud_ability_queue.renders}, suppressed: {hud_ability_queue.suppressed_renders()}")
+        hud_ability_queue.reset_render_counts()
+        
     def add_noise_log(action: str, noise: str):
         """Add a log visualizing the action and the noise"""
-        actions.user.hud_add_log("command", "<*" + action + "/> «" + noise + "»")
+        noise_log.add(action, noise)
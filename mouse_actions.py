@@ -1,6 +1,101 @@
 from talon import actions, Context, Module, ctrl
 from talon_plugins import eye_mouse, eye_zoom_mouse
 from talon_plugins.eye_mouse import config, toggle_camera_overlay, toggle_control
+from .clock import now
+from .frame_scheduler import frame_scheduler
+from collections import deque
+from typing import Tuple
+import threading
+
+# Polled after the directions and momentum so the pointer position is read at the end of a frame
+ORDER_KINGFISHER = 30
+
+class KingfisherClick:
+    """Non-blocking click pipeline that turns on the eyetracker until the pointer settles, then clicks and returns the mouse
+    
+    The stages are run from the frame scheduler instead of sleeping, and the latency of every stage is kept for tuning
+    Clicks arrive on the noise thread while the pipeline finishes on the frame thread, so the pending clicks are guarded by a lock
+    """
+    busy = False
+    clicks: int = 0
+    origin: Tuple[int, int] = (0, 0)
+    last_position: Tuple[int, int] = (0, 0)
+    start_ts: float = 0.0
+    
+    # The gaze stage ends as soon as the pointer moved and stayed within the settle distance for a frame
+    # Or after the maximum gaze duration if the pointer does not settle
+    settle_distance: float = 2.0
+    max_gaze_duration: float = 0.05
+    
+    def __init__(self, history: int = 100):
+        self.lock = threading.Lock()
+        self.latencies = {
+            "gaze": deque(maxlen=history),
+            "click": deque(maxlen=history),
+            "total": deque(maxlen=history),
+        }
+    
+    def click(self, times: int):
+        """Start the pipeline, or add clicks to the one in progress"""
+        with self.lock:
+            if self.busy:
+                self.clicks += times
+                return
+            
+            self.busy = True
+            self.clicks = times
+        self.start_ts = now()
+        self.origin = ctrl.mouse_pos()
+        self.last_position = self.origin
+        actions.user.enable_tracker_mouse()
+        frame_scheduler.subscribe(self.poll_gaze, ORDER_KINGFISHER)
+        
+    def poll_gaze(self) -> bool:
+        position = ctrl.mouse_pos()
+        moved = distance(position, self.origin) > self.settle_distance
+        settled = moved and distance(position, self.last_position) <= self.settle_distance
+        self.last_position = position
+        
+        if settled or now() - self.start_ts >= self.max_gaze_duration:
+            self.finish()
+        return True
+        
+    def finish(self):
+        frame_scheduler.unsubscribe(self.poll_gaze)
+        gaze_ts = now()
+        actions.user.disable_tracker_mouse()
+        
+        # Clicks that are added while clicking are sent at the same target
+        clicks = self.take_clicks()
+        while clicks > 0:
+            for i in range(clicks):
+                ctrl.mouse_click(0)
+            clicks = self.take_clicks()
+        ctrl.mouse_move(self.origin[0], self.origin[1])
+        
+        end_ts = now()
+        self.latencies["gaze"].append(gaze_ts - self.start_ts)
+        self.latencies["click"].append(end_ts - gaze_ts)
+        self.latencies["total"].append(end_ts - self.start_ts)
+        
+        # Clicks that arrived while the mouse was moved back start a new pipeline
+        with self.lock:
+            clicks = self.clicks
+            self.clicks = 0
+            self.busy = False
+        if clicks > 0:
+            self.click(clicks)
+            
+    def take_clicks(self) -> int:
+        with self.lock:
+            clicks = self.clicks
+            self.clicks = 0
+        return clicks
+
+def distance(a: Tuple[int, int], b: Tuple[int, int]) -> float:
+    return ((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5
+
+kingfisher = KingfisherClick()
 
 ctx = Context()
 mod = Module()
@@ -9,15 +104,13 @@ class Actions:
 
     def kingfisher_click(times: int):
         """Activates the eyetracker for a brief second to move the mouse, then clicks the targeted area N times, and returns the mouse back to where it was"""
-        pos = ctrl.mouse_pos()
+        kingfisher.click(times)
         
-        actions.user.enable_tracker_mouse()
-        actions.sleep(0.05)
-        actions.user.disable_tracker_mouse()
-        
-        for i in range(times):
-            ctrl.mouse_click(0)
-        ctrl.mouse_move(pos[0], pos[1])
+    def kingfisher_latency_log():
+        """Print the average and maximum latency of every stage of the recent kingfisher clicks in milliseconds"""
+        for stage, latencies in kingfisher.latencies.items():
+            if len(latencies) > 0:
+                print(f"Kingfisher {stage} - average: {sum(latencies) / len(latencies) * 1000:.1f}ms, max: {max(latencies) * 1000:.1f}ms")
 
     def enable_tracker_mouse():
         """Enables both eyetracking and the zoom mouse"""
@@ -25,4 +118,4 @@ class Actions:
         
     def disable_tracker_mouse():
         """Disables eyetracking and the zoom mouse"""
-        actions.key("f4")
\ No newline at end of file
+        actions.key("f4")
@@ -0,0 +1,132 @@
+from talon import cron, Module
+import json
+import math
+import os
+
+# Observations are clustered on their logarithm, as hold durations vary a lot more than tap durations
+INITIAL_TAP_DURATION = 0.1
+INITIAL_HOLD_DURATION = 0.6
+
+# Amount of taps that have to be observed before the learned threshold is trusted
+MIN_TAP_COUNT = 20
+
+# The learned threshold never drops below this, so noise recognition jitter does not turn every hold into a tap
+MIN_STARTING_THROTTLE = 0.05
+
+class NoiseDurationModel:
+    """Streaming two-cluster estimate of the durations of discrete taps and continuous holds
+
+    Every observed duration is assigned to the nearest cluster, which keeps an exponentially weighted mean and variance
+    """
+    tap_mean: float
+    tap_variance: float
+    tap_count: int
+    hold_mean: float
+    hold_variance: float
+    hold_count: int
+
+    # Weight of a new observation once a cluster has seen enough of them to forget older sessions slowly
+    learning_rate: float = 0.05
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.tap_mean = math.log(INITIAL_TAP_DURATION)
+        self.tap_variance = 0.0
+        self.tap_count = 0
+        self.hold_mean = math.log(INITIAL_HOLD_DURATION)
+        self.hold_variance = 0.0
+        self.hold_count = 0
+
+    def observe(self, duration: float):
+        if duration <= 0.0:
+            return
+
+        value = math.log(duration)
+        if abs(value - self.tap_mean) <= abs(value - self.hold_mean):
+            self.tap_count += 1
+            self.tap_mean, self.tap_variance = self.update(self.tap_mean, self.tap_variance, self.tap_count, value)
+        else:
+            self.hold_count += 1
+            self.hold_mean, self.hold_variance = self.update(self.hold_mean, self.hold_variance, self.hold_count, value)
+
+    def update(self, mean: float, variance: float, count: int, value: float):
+        rate = max(1 / count, self.learning_rate)
+        delta = value - mean
+        mean += rate * delta
+        variance = (1 - rate) * (variance + rate * delta * delta)
+        return mean, variance
+
+    def threshold(self, default: float) -> float:
+        """Smallest starting throttle that keeps nearly all taps discrete, never exceeding the configured default"""
+        if self.tap_count < MIN_TAP_COUNT:
+            return default
+
+        tap_upper_bound = math.exp(self.tap_mean + 2 * math.sqrt(self.tap_variance))
+        return min(default, max(MIN_STARTING_THROTTLE, tap_upper_bound))
+
+    def to_dict(self) -> dict:
+        return {
+            "tap_mean": self.tap_mean,
+            "tap_variance": self.tap_variance,
+            "tap_count": self.tap_count,
+            "hold_mean": self.hold_mean,
+            "hold_variance": self.hold_variance,
+            "hold_count": self.hold_count,
+        }
+
+    def from_dict(self, values: dict):
+        self.tap_mean = float(values.get("tap_mean", self.tap_mean))
+        self.tap_variance = float(values.get("tap_variance", self.tap_variance))
+        self.tap_count = int(values.get("tap_count", self.tap_count))
+        self.hold_mean = float(values.get("hold_mean", self.hold_mean))
+        self.hold_variance = float(values.get("hold_variance", self.hold_variance))
+        self.hold_count = int(values.get("hold_count", self.hold_count))
+
+class PersistedNoiseDurations(NoiseDurationModel):
+    """Noise duration model that is stored between sessions, saves are delayed so a burst of noises only writes once"""
+    path: str = ""
+    save_job = None
+    save_delay: str = "10s"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as file:
+                    self.from_dict(json.load(file))
+            except (OSError, ValueError):
+                print(f"Could not load the learned noise durations from {self.path}, starting over")
+                self.clear()
+
+    def observe(self, duration: float):
+        super().observe(duration)
+        if self.save_job is None:
+            self.save_job = cron.after(self.save_delay, self.save)
+
+    def save(self):
+        self.save_job = None
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+noise_durations = PersistedNoiseDurations(os.path.join(os.path.dirname(os.path.abspath(__file__)), "noise_durations.json"))
+
+mod = Module()
+@mod.action_class
+class Actions:
+
+    def noise_durations_log():
+        """Print the learned tap and hold durations and the starting throttle they result in"""
+        print(f"Taps: {noise_durations.tap_count} around {math.exp(noise_durations.tap_mean) * 1000:.0f}ms, " +
+            f"holds: {noise_durations.hold_count} around {math.exp(noise_durations.hold_mean) * 1000:.0f}ms, " +
+            f"starting throttle: {noise_durations.threshold(0.3) * 1000:.0f}ms")
+
+    def noise_durations_reset():
+        """Forget the learned noise durations"""
+        noise_durations.clear()
+        noise_durations.save()
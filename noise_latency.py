@@ -0,0 +1,95 @@
+from talon import Module
+from .clock import now
+from typing import Dict, List, Tuple
+import json
+import math
+import os
+
+# Buckets grow by a factor of 2^(1/4) starting at 0.1 milliseconds, which covers up to roughly 100 seconds
+BUCKETS_PER_OCTAVE = 4
+BUCKET_COUNT = 80
+MIN_LATENCY_MS = 0.1
+
+def bucket_upper_bound(index: int) -> float:
+    """Upper bound of the bucket in milliseconds"""
+    return MIN_LATENCY_MS * 2 ** ((index + 1) / BUCKETS_PER_OCTAVE)
+
+class LatencyHistograms:
+    """Log-bucketed histograms of the time between the timestamp parrot gave a noise and the moment its action was handled
+
+    Callers check the enabled flag themselves before recording, so disabled instrumentation costs a single attribute lookup
+    """
+    enabled: bool = False
+    histograms: Dict[Tuple[str, str], List[int]]
+
+    def __init__(self):
+        self.histograms = {}
+
+    def record(self, action: str, profile: str, ts: float):
+        latency_ms = (now() - ts) * 1000
+        index = 0
+        if latency_ms > MIN_LATENCY_MS:
+            index = min(BUCKET_COUNT - 1, int(math.log2(latency_ms / MIN_LATENCY_MS) * BUCKETS_PER_OCTAVE))
+
+        key = (action, profile)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = [0] * BUCKET_COUNT
+            self.histograms[key] = histogram
+        histogram[index] += 1
+
+    def clear(self):
+        self.histograms = {}
+
+    def percentile(self, histogram: List[int], p: float) -> float:
+        """Approximate percentile in milliseconds, using the upper bound of the bucket it falls in"""
+        total = sum(histogram)
+        threshold = total * p / 100
+        seen = 0
+        for index, count in enumerate(histogram):
+            seen += count
+            if count > 0 and seen >= threshold:
+                return bucket_upper_bound(index)
+        return 0.0
+
+    def summary(self) -> list:
+        summary = []
+        for (action, profile), histogram in sorted(self.histograms.items()):
+            summary.append({
+                "action": action,
+                "profile": profile,
+                "count": sum(histogram),
+                "p50_ms": self.percentile(histogram, 50),
+                "p90_ms": self.percentile(histogram, 90),
+                "p99_ms": self.percentile(histogram, 99),
+                "buckets": {f"{bucket_upper_bound(index):.3f}": count for index, count in enumerate(histogram) if count > 0}
+            })
+        return summary
+
+    def dump(self, path: str):
+        """Write the summary and non-empty buckets of every histogram to a JSON file"""
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=4)
+
+noise_latency = LatencyHistograms()
+latency_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+mod = Module()
+@mod.action_class
+class Actions:
+
+    def noise_latency_enable(enabled: bool = True):
+        """Enable or disable recording the latency between noises and their actions"""
+        noise_latency.enabled = enabled
+
+    def noise_latency_clear():
+        """Clear all the recorded latency histograms"""
+        noise_latency.clear()
+
+    def noise_latency_dump(name: str = ""):
+        """Write the latency histograms to a JSON file in the recordings folder"""
+        filename = "latency_" + (name if name else str(int(now()))) + ".json"
+        noise_latency.dump(os.path.join(latency_folder, filename))
@@ -0,0 +1,43 @@
+from talon import actions, cron
+from collections import deque
+from typing import Deque, List, Tuple
+from .clock import now
+
+class NoiseLog:
+    """Ring buffer of formatted noise log entries that are sent to the HUD in batches on a timer
+
+    When noises are logged faster than they are flushed, the oldest entries that have not been shown yet are dropped
+    """
+    job = None
+    flush_interval: str = "100ms"
+
+    # Entries waiting to be sent to the HUD, and every recent entry for debugging
+    pending: Deque[str]
+    history: Deque[Tuple[float, str]]
+    dropped: int = 0
+
+    def __init__(self, max_pending: int = 5, history_size: int = 100):
+        self.pending = deque(maxlen=max_pending)
+        self.history = deque(maxlen=history_size)
+        self.dropped = 0
+
+    def add(self, action: str, noise: str):
+        entry = "<*" + action + "/> «" + noise + "»"
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(entry)
+        self.history.append((now(), entry))
+
+        if self.job is None:
+            self.job = cron.after(self.flush_interval, self.flush)
+
+    def flush(self):
+        self.job = None
+        while self.pending:
+            actions.user.hud_add_log("command", self.pending.popleft())
+
+    def entries(self) -> List[Tuple[float, str]]:
+        """Recently logged entries with their timestamps, oldest first"""
+        return list(self.history)
+
+noise_log = NoiseLog()
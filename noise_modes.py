@@ -1,64 +1,146 @@
 from talon import Context, Module, actions, cron
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import time
 
 parrot_modes = {
     "parrot_switch": "Switch mode that disables speech and lets us choose a noise mode",
     "parrot_mouse": "Enable simple parrot mouse for scrolling, dragging and clicking",
     "parrot_eyemouse": "Enables eyetracker mouse",
     "parrot_media": "Enables specific controls for media playing",
-    "parrot_media_fullscreen": "Enables specific controls for media playing while fullscreen"   
+    "parrot_media_fullscreen": "Enables specific controls for media playing while fullscreen"
 }
 
 ctx = Context()
 mod = Module()
-current_parrot_mode = ""
 has_talon_hud_actions = True # Set this to True if you have talon_hud as it enables a bunch of niceties
 
 for parrot_mode in parrot_modes.keys():
     mod.mode(parrot_mode)
 
-parrot_switch_job = None
-def switch_parrot_mode(mode):
-    cron.cancel(parrot_switch_job)
-    global current_parrot_mode
-    global has_talon_hud_actions
-    if current_parrot_mode != mode:
-        if current_parrot_mode != "":
-            actions.mode.disable(f"user.{current_parrot_mode}")
+# The switch mode reverts back to regular command mode if no noise was made within this time
+switch_timeout = "1500ms"
+
+@dataclass(frozen=True)
+class ModeTransition:
+    """Talon mode calls needed to go from one parrot mode to another, an empty mode is regular command mode"""
+    disable: Optional[str]
+    enable: Optional[str]
+
+    # Whether speech should be enabled after the transition, None leaves it as it is
+    speech: Optional[bool]
+
+def build_transitions(modes) -> Dict[Tuple[str, str], ModeTransition]:
+    transitions = {}
+    for current in ("",) + tuple(modes):
+        for mode in ("",) + tuple(modes):
+            if current != mode:
+                speech = False if mode == "parrot_switch" else True if mode == "" else None
+                transitions[(current, mode)] = ModeTransition(
+                    f"user.{current}" if current else None,
+                    f"user.{mode}" if mode else None,
+                    speech
+                )
+    return transitions
+
+class NoiseModeController:
+    """Switches between the parrot modes using a precomputed transition table, and keeps the time every switch took"""
+    current_mode: str = ""
+    speech_enabled: bool = True
+    switch_job = None
+    transitions: Dict[Tuple[str, str], ModeTransition]
+
+    def __init__(self, modes, history: int = 100):
+        self.modes = tuple(modes)
+        self.transitions = build_transitions(self.modes)
+        self.latencies = deque(maxlen=history)
+
+    def switch(self, mode: str):
+        self.cancel_timeout()
+        transition = self.transitions.get((self.current_mode, mode))
+        if transition is None:
+            if mode == "":
+                self.disable_all()
+                return
+            elif mode == self.current_mode:
+                return
+            
+            # Unknown modes are still enabled, they might have been defined outside of this file
+            if mode not in self.modes:
+                print(f"Unknown parrot mode {mode}, switching to user.{mode} anyway")
+            transition = ModeTransition(f"user.{self.current_mode}" if self.current_mode else None, f"user.{mode}", None)
+
+        start = time.perf_counter()
+        if transition.disable is not None:
+            actions.mode.disable(transition.disable)
             if has_talon_hud_actions:
                 actions.user.hud_remove_status_icon("parrot_icon")
-        actions.mode.enable(f"user.{mode}")
-        current_parrot_mode = mode
+        if transition.enable is not None:
+            actions.mode.enable(transition.enable)
+            if has_talon_hud_actions:
+                actions.user.hud_add_status_icon("parrot_icon", mode)
+        if transition.speech or ( transition.speech is False and self.speech_enabled ):
+            self.set_speech(transition.speech)
+
+        self.latencies.append((self.current_mode, mode, time.perf_counter() - start))
+        self.current_mode = mode
+
+    def disable_all(self):
+        """Disable every parrot mode, the current mode might not be the one Talon has enabled after a reload of this file"""
+        start = time.perf_counter()
+        for mode in self.modes:
+            actions.mode.disable(f"user.{mode}")
+        if self.current_mode and self.current_mode not in self.modes:
+            actions.mode.disable(f"user.{self.current_mode}")
         if has_talon_hud_actions:
-            actions.user.hud_add_status_icon("parrot_icon", current_parrot_mode)
-
-def disable_parrot_mode():
-    global current_parrot_mode
-    global parrot_modes
-    
-    cron.cancel(parrot_switch_job)
-    actions.speech.enable()
-    current_parrot_mode = ""
-    for parrot_mode in parrot_modes.keys():
-        actions.mode.disable(f"user.{parrot_mode}")
-    if has_talon_hud_actions:
-        actions.user.hud_remove_status_icon("parrot_icon")
-        
+            actions.user.hud_remove_status_icon("parrot_icon")
+        self.set_speech(True)
+        self.latencies.append((self.current_mode, "", time.perf_counter() - start))
+        self.current_mode = ""
+
+    def set_speech(self, enabled: bool):
+        if enabled:
+            actions.speech.enable()
+        else:
+            actions.speech.disable()
+        self.speech_enabled = enabled
+
+    def switch_with_timeout(self, mode: str):
+        """Switch to the mode and go back to command mode once if no other switch has happened before the timeout"""
+        self.switch(mode)
+        self.switch_job = cron.after(switch_timeout, self.timeout)
+
+    def timeout(self):
+        self.switch_job = None
+        self.switch("")
+
+    def cancel_timeout(self):
+        if self.switch_job is not None:
+            cron.cancel(self.switch_job)
+            self.switch_job = None
+
+noise_mode_controller = NoiseModeController(parrot_modes.keys())
 
 @mod.action_class
 class Actions:
 
     def enable_switching_parrot_mode():
         """Enables the switching mode which will only be active for about one and a half seconds before reverting back to regular command mode if no noise was made"""
-        global parrot_switch_job
-        global current_parrot_mode
-        switch_parrot_mode("parrot_switch")
-        parrot_switch_job = cron.interval('1500ms', disable_parrot_mode)
-        actions.speech.disable()
+        noise_mode_controller.switch_with_timeout("parrot_switch")
 
     def switch_parrot_mode(mode: str):
         """Switches the parrot mode around"""
-        switch_parrot_mode(mode)
-     
+        noise_mode_controller.switch(mode)
+
     def disable_parrot_modes():
         """Disables the current parrot mode"""
-        disable_parrot_mode()
+        noise_mode_controller.switch("")
+
+    def noise_mode_latency_log():
+        """Print the average and maximum time the recent parrot mode switches took in milliseconds"""
+        switches = {}
+        for current, mode, latency in noise_mode_controller.latencies:
+            switches.setdefault((current or "command", mode or "command"), []).append(latency)
+        for (current, mode), latencies in sorted(switches.items()):
+            print(f"Mode switch {current} -> {mode} - average: {sum(latencies) / len(latencies) * 1000:.3f}ms, max: {max(latencies) * 1000:.3f}ms")
@@ -0,0 +1,44 @@
+from talon import Module
+from .clock import now
+from typing import Any
+import json
+import os
+
+class NoiseRecorder:
+    """Records the calls made into the noise actions as a JSONL trace so sessions can be replayed later"""
+    file = None
+    path: str = ""
+    
+    def start(self, path: str):
+        """Start recording to the given file, replacing any previous recording"""
+        self.stop()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8")
+        
+    def stop(self):
+        """Stop recording and close the trace file"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            
+    def record(self, action: str, *args: Any):
+        """Append an action call to the trace, this is a no-op when not recording"""
+        if self.file is not None:
+            self.file.write(json.dumps([now(), action, args]) + "\n")
+
+noise_recorder = NoiseRecorder()
+recordings_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+mod = Module()
+@mod.action_class
+class Actions:
+
+    def noise_recorder_start(name: str = ""):
+        """Start recording the noise actions to a trace in the recordings folder"""
+        filename = (name if name else str(int(now()))) + ".jsonl"
+        noise_recorder.start(os.path.join(recordings_folder, filename))
+        
+    def noise_recorder_stop():
+        """Stop recording the noise actions"""
+        noise_recorder.stop()
@@ -0,0 +1,160 @@
+from talon import actions, ctrl, Module
+from typing import Callable, List, Set, Union
+import threading
+
+class OutputBatch:
+    """Output collected by a single thread, noises and frame ticks can arrive on different threads and each flush their own batch"""
+    depth: int = 0
+    move_x: float = 0
+    move_y: float = 0
+    scroll_y: float = 0
+    
+    # Key presses and other actions in the order they were requested, so text navigation keeps its order
+    commands: List[Union[str, Callable[[], None]]]
+    
+    # Keys pressed within the current scope, a key is only sent once per scope
+    scope_keys: Set[str]
+    
+    # Used for measuring how many OS level calls were saved by buffering
+    requested_calls: int = 0
+    issued_calls: int = 0
+    
+    def __init__(self):
+        self.commands = []
+        self.scope_keys = set()
+        self.clear()
+        
+    def clear(self):
+        self.move_x = 0
+        self.move_y = 0
+        self.scroll_y = 0
+        self.commands.clear()
+        self.scope_keys.clear()
+        
+    def flush(self):
+        if self.move_x != 0 or self.move_y != 0:
+            self.issued_calls += 1
+            actions.user.mouse_relative_move(self.move_x, self.move_y)
+        if self.scroll_y != 0:
+            self.issued_calls += 1
+            ctrl.mouse_scroll(self.scroll_y)
+        for command in self.commands:
+            self.issued_calls += 1
+            if isinstance(command, str):
+                actions.key(command)
+            else:
+                command()
+        self.clear()
+
+class OutputBuffer:
+    """Collects the synthetic input of a single tick or noise event and flushes it with as few OS level calls as possible
+    
+    Relative mouse moves are merged into a single vector, scrolls are summed and zero scrolls dropped
+    Key presses and other actions are sent in the order they were requested, duplicate key presses are only sent once per scope
+    Every begin call starts a new scope, so a key pressed by two slots in the same frame is still sent twice
+    Every thread gets its own batch, which is flushed when the outermost batch of that thread ends
+    """
+    local: threading.local
+    batches: List[OutputBatch]
+    lock: threading.Lock
+    
+    def __init__(self):
+        self.local = threading.local()
+        self.batches = []
+        self.lock = threading.Lock()
+        
+    def batch(self) -> OutputBatch:
+        batch = getattr(self.local, "batch", None)
+        if batch is None:
+            batch = self.local.batch = OutputBatch()
+            with self.lock:
+                self.batches.append(batch)
+        return batch
+        
+    @property
+    def depth(self) -> int:
+        """Batch depth of the calling thread"""
+        return self.batch().depth
+        
+    def begin(self):
+        """Start buffering output until the matching end call"""
+        batch = self.batch()
+        batch.depth += 1
+        batch.scope_keys.clear()
+        
+    def end(self):
+        """End a batch, flushing the output once the outermost batch has ended"""
+        batch = self.batch()
+        batch.depth = max(0, batch.depth - 1)
+        if batch.depth == 0:
+            batch.flush()
+    
+    def mouse_move(self, x: float, y: float):
+        batch = self.batch()
+        batch.requested_calls += 1
+        batch.move_x += x
+        batch.move_y += y
+        if batch.depth == 0:
+            batch.flush()
+            
+    def scroll(self, y: float):
+        batch = self.batch()
+        batch.requested_calls += 1
+        batch.scroll_y += y
+        if batch.depth == 0:
+            batch.flush()
+        
+    def key(self, key: str):
+        batch = self.batch()
+        batch.requested_calls += 1
+        if key not in batch.scope_keys:
+            batch.scope_keys.add(key)
+            batch.commands.append(key)
+        if batch.depth == 0:
+            batch.flush()
+            
+    def action(self, action: Callable[[], None]):
+        """Run an action in order with the buffered key presses"""
+        batch = self.batch()
+        batch.requested_calls += 1
+        batch.commands.append(action)
+        if batch.depth == 0:
+            batch.flush()
+            
+    def flush(self):
+        self.batch().flush()
+        
+    def open_batches(self) -> int:
+        """Amount of threads that are still inside a batch"""
+        with self.lock:
+            return sum(1 for batch in self.batches if batch.depth > 0)
+        
+    @property
+    def requested_calls(self) -> int:
+        with self.lock:
+            return sum(batch.requested_calls for batch in self.batches)
+        
+    @property
+    def issued_calls(self) -> int:
+        with self.lock:
+            return sum(batch.issued_calls for batch in self.batches)
+        
+    def saved_calls(self) -> int:
+        return self.requested_calls - self.issued_calls
+        
+    def reset_call_counts(self):
+        with self.lock:
+            for batch in self.batches:
+                batch.requested_calls = 0
+                batch.issued_calls = 0
+
+output_buffer = OutputBuffer()
+
+mod = Module()
+@mod.action_class
+class Actions:
+
+    def output_buffer_log_calls():
+        """Print the amount of output calls requested, issued and saved since the last reset and reset the counters"""
+        print(f"Output calls - requested: {output_buffer.requested_calls}, issued: {output_buffer.issued_calls}, saved: {output_buffer.saved_calls()}")
+        output_buffer.reset_call_counts()
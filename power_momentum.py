@@ -1,30 +1,63 @@
 from talon import actions, cron, Context, Module, ctrl
 from typing import Callable
-import numpy as np
+import bisect
+import math
+from .clock import now
+from .noise_recorder import noise_recorder
+from .noise_latency import noise_latency
+from .frame_scheduler import frame_scheduler, ORDER_MOMENTUM
+from .output_buffer import output_buffer
+
+# Momentum below this value does not result in any noticeable action
+idle_momentum = 0.5
+
+# The momentum decays by this factor every 16 milliseconds
+# It is evaluated as a continuous exponential decay so it does not drift when frames are missed
+momentum_decay = 0.9765
+momentum_decay_interval = 0.016
 
 class PowerMomentum:
-    job = None
     cb: Callable[[float], None]
     momentum_increasing = True
+    
+    # The momentum is stored as its value at momentum_ts, use momentum_at to get its current value
     momentum: float = 0.1
+    momentum_ts: float = 0.0
+    decay_rate: float = -math.log(momentum_decay) / momentum_decay_interval
+    
     starting_ts: float = 0
     power_scaling = 2.0
+    
+    # Timestamp of the first noise that added momentum since the last callback, used for measuring latency
+    pending_ts: float = 0.0
 
     def __init__(self):
-        self.job = None
         self.cb = lambda momentum: print(f'{momentum:.1f}')
 
     def set_callback(self, cb: Callable):
         """Set the callback that will be triggered with each momentum update"""
         self.cb = cb
+        
+    def set_momentum(self, momentum: float, ts: float):
+        self.momentum = momentum
+        self.momentum_ts = ts
+
+    def momentum_at(self, ts: float) -> float:
+        """Get the momentum at the given time, it can be sampled at any rate"""
+        elapsed = ts - self.momentum_ts
+        if elapsed <= 0 or self.momentum == 0.0:
+            return self.momentum
+        return self.momentum * math.exp(-self.decay_rate * elapsed)
 
     def start(self, ts):
         """Start building momentum"""
+        # A session that was suspended before decaying never reached the stop callback, so end it before starting a new one
+        if not frame_scheduler.is_subscribed(self.momentum_job):
+            self.cb(0)
         self.starting_ts = ts
-        cron.cancel(self.job)
         self.momentum_increasing = True
-        self.momentum = max(0.1, self.momentum)
-        self.job = cron.interval('16ms', self.momentum_job)
+        self.set_momentum(max(0.1, self.momentum_at(ts)), ts)
+        frame_scheduler.subscribe(self.momentum_job, ORDER_MOMENTUM)
         
     def mark_decay(self):
         """Mark the momentum as no longer increasing"""
@@ -33,61 +66,124 @@ class PowerMomentum:
         
     def stop(self):
         """Stop all momentum immediately"""    
-        self.momentum = 0
+        self.set_momentum(0, now())
         self.momentum_increasing = False
-        cron.cancel(self.job)
+        frame_scheduler.unsubscribe(self.momentum_job)
         self.cb(self.momentum)
 
     def add_momentum(self, ts: float, power: float):
         """Increase the momentum based on the duration of the sound and the power"""
         duration_ms = (ts - self.starting_ts ) * 1000
+        momentum = self.momentum_at(ts)
         
         # For short duration sounds, make the power count more towards the momentum value
         if duration_ms / 130 < 1:
-            self.momentum += ( power * self.power_scaling / 2 )
+            momentum += ( power * self.power_scaling / 2 )
         
         # For any duration longer than 130 milliseconds, increase the momentum more and more over time        
         else:
-            self.momentum += ( power * self.power_scaling / 5 ) * np.sqrt([duration_ms / 100])[0]
+            momentum += ( power * self.power_scaling / 5 ) * math.sqrt(duration_ms / 100)
+        self.set_momentum(momentum, ts)
+        
+        if noise_latency.enabled and self.pending_ts == 0.0:
+            self.pending_ts = ts
+        
+        if momentum >= idle_momentum:
+            frame_scheduler.subscribe(self.momentum_job, ORDER_MOMENTUM)
 
-    def momentum_job(self):
-        self.momentum = self.momentum * 0.9765
-        if self.momentum_increasing == False and self.momentum < 0.5 or self.momentum == 0.0:
-            self.momentum = 0
-            cron.cancel(self.job)
-        self.cb(self.momentum)
+    def momentum_job(self) -> bool:
+        momentum = self.momentum_at(now())
+        if self.momentum_increasing == False and momentum < 0.5 or momentum == 0.0:
+            self.set_momentum(0, now())
+            frame_scheduler.unsubscribe(self.momentum_job)
+            self.cb(self.momentum)
+            return False
+        
+        # Suspend the job while the momentum is too low to do anything
+        # It is resumed as soon as momentum gets added again
+        elif momentum < idle_momentum:
+            frame_scheduler.unsubscribe(self.momentum_job)
+            return False
+        
+        self.cb(momentum)
+        if self.pending_ts != 0.0:
+            if noise_latency.enabled:
+                noise_latency.record("power_momentum_dispatch", self.cb.__name__, self.pending_ts)
+            self.pending_ts = 0.0
+        return True
 
 power_momentum = PowerMomentum()
 
 float_scrolling_allowed = True
+
+# Sends fractional scroll amounts straight to the OS instead of accumulating them into whole scroll ticks
+# Only useful for programs that support high resolution scrolling
+high_resolution_scrolling = False
+
 # Scrolling code
-scroll_tick_index = 0
 scroll_tick_thresholds = [1, 0.99, 0.96, 0.93, 0.90, 0.85, 0.80, 0.75, 0.70, 0.60, 0.45, 0.33, 0.0]
-previous_scroll = 0
-
-def scroll_momentum(momentum: float):
-    global scroll_tick_index, previous_scroll
-    scroll = momentum / 20
-    if not float_scrolling_allowed and scroll > previous_scroll:
-    	for index, value in enumerate(scroll_tick_thresholds):
-    		if value < scroll:
-    			scroll_tick_index = index
-    			break
-    previous_scroll = scroll
+
+class ScrollEngine:
+    """Turns momentum into scroll output for a single scroll direction
+    
+    Fractional scroll amounts are accumulated so slow scrolling is not lost to truncation
+    """
+    direction: int
+    tick_index: int = 0
+    previous_scroll: float = 0.0
+    remainder: float = 0.0
+
+    def __init__(self, direction: int, thresholds = scroll_tick_thresholds):
+        self.direction = direction
+        self.thresholds = thresholds
+        
+        # The thresholds are descending, so they are negated to allow for bisecting
+        self.negated_thresholds = [-value for value in thresholds]
+        self.clear()
+        
+    def clear(self):
+        self.tick_index = 0
+        self.previous_scroll = 0.0
+        self.remainder = 0.0
+
+    def scroll_amount(self, momentum: float) -> float:
+        scroll = momentum / 20
+        if not float_scrolling_allowed:
+            # Find the first threshold below the scroll amount
+            if scroll > self.previous_scroll:
+                index = bisect.bisect_right(self.negated_thresholds, -scroll)
+                if index < len(self.thresholds):
+                    self.tick_index = index
+            self.previous_scroll = scroll
+        
+            if scroll < 1:
+                scroll = 1 if scroll < self.thresholds[self.tick_index] else 0
+                if scroll == 1:
+                    self.tick_index = min(len(self.thresholds) - 1, self.tick_index + 1)
+        return scroll
+        
+    def scroll(self, momentum: float):
+        if momentum == 0:
+            self.clear()
+            return
     
-    if scroll < 1 and not float_scrolling_allowed:
-        scroll = 1 if scroll < scroll_tick_thresholds[scroll_tick_index] else 0
-        if scroll == 1:
-        	scroll_tick_index = min(len(scroll_tick_thresholds) - 1, scroll_tick_index + 1)
-    return scroll
+        scroll = self.scroll_amount(momentum)
+        if high_resolution_scrolling:
+            output_buffer.scroll(self.direction * scroll)
+        else:
+            self.remainder += scroll
+            whole_scroll = int(self.remainder)
+            self.remainder -= whole_scroll
+            output_buffer.scroll(self.direction * whole_scroll)
+
+scroll_up_engine = ScrollEngine(-1)
+scroll_down_engine = ScrollEngine(1)
 
 def scroll_up(momentum: float):
-    scroll = scroll_momentum(momentum)
-    ctrl.mouse_scroll(-int(scroll))
+    scroll_up_engine.scroll(momentum)
     
 def scroll_down(momentum: float):
-    scroll = scroll_momentum(momentum)
-    ctrl.mouse_scroll(int(scroll))
+    scroll_down_engine.scroll(momentum)
 
 ctx = Context()
 mod = Module()
@@ -96,32 +192,42 @@ class Actions:
                 
     def power_momentum_start(ts: float, power_scaling: float):
         """Start building momentum with the scaling factor"""
+        noise_recorder.record("power_momentum_start", ts, power_scaling)
         global power_momentum
+        if noise_latency.enabled:
+            noise_latency.record("power_momentum_start", power_momentum.cb.__name__, ts)
         power_momentum.power_scaling = power_scaling        
         power_momentum.start(ts)
         
     def power_momentum_stop():
         """Instantaniously stop the momentum"""
+        noise_recorder.record("power_momentum_stop")
         global power_momentum
         power_momentum.stop()
         
     def power_momentum_add(ts: float, power: float):
         """Increase the momentum by adding time and power"""
+        noise_recorder.record("power_momentum_add", ts, power)
         global power_momentum
+        if noise_latency.enabled:
+            noise_latency.record("power_momentum_add", power_momentum.cb.__name__, ts)
         power_momentum.add_momentum(ts, power)
         
     def power_momentum_decaying():
         """Mark the momentum as in a decaying state"""
+        noise_recorder.record("power_momentum_decaying")
         global power_momentum
         power_momentum.mark_decay()
         
     def power_momentum_scroll_down():
         """Set the power momentum callback to a scrolling down function"""
+        noise_recorder.record("power_momentum_scroll_down")
         global power_momentum
         power_momentum.set_callback(scroll_down)
         
     def power_momentum_scroll_up():
         """Set the power momentum callback to a scrolling up function"""
+        noise_recorder.record("power_momentum_scroll_up")
         global power_momentum
         power_momentum.set_callback(scroll_up)
         
@@ -0,0 +1,398 @@
+"""Latency benchmarks for the hot paths of the noise scripts
+
+Run from the repository root with
+    python -m tools.benchmark [--events 20000] [--seed 0]
+"""
+import argparse
+import random
+import time
+from . import harness
+
+def new_hummingbird(hummingbird2, profile: str):
+    hb = hummingbird2.HummingBird(hummingbird2.DirectionVisualizer())
+    hb.set_profile(profile)
+    return hb
+
+def bench_activate_direction(hummingbird2, events: list, profile: str):
+    hb = new_hummingbird(hummingbird2, profile)
+    return harness.measure(f"HummingBird.activate_direction [{profile}]", events,
+        lambda ts, direction, lifecycle: hb.activate_direction(direction, ts, lifecycle))
+
+def bench_tick_directions(hummingbird2, count: int, profile: str):
+    talon = harness.talon()
+    hb = new_hummingbird(hummingbird2, profile)
+    hb.start_continuous_job()
+    hb.activate_direction("up", 0.0, "start")
+    hb.activate_direction("left", 0.0, "start")
+    result = harness.measure(f"HummingBird.tick_directions [{profile}]", [()] * count, hb.tick_directions)
+    hb.end_continuous_job()
+    talon.cron.reset()
+    return result
+
+def bench_key_release(hummingbird2, count: int, seed: int):
+    """Measure how long noise handling blocks while releasing held keys, two releases per event under MONO exclusion"""
+    talon = harness.talon()
+    hb = new_hummingbird(hummingbird2, "wasd")
+    hb.set_exclusion_strategy(hummingbird2.HummingExclusionStrategy.MONO)
+    rng = random.Random(seed)
+    events = []
+    for index in range(count):
+        first, second = rng.sample(hummingbird2.DIRECTIONS, 2)
+        events.append((index * 1.0, first, second))
+
+    def press_and_release(ts, first, second):
+        hb.activate_direction(first, ts, "start")
+        hb.activate_direction(second, ts + 0.1, "start")
+        hb.activate_direction(second, ts + 0.2, "stop")
+    result = harness.measure("HummingBird key release [wasd, MONO]", events, press_and_release)
+    talon.cron.reset()
+    return result
+
+def bench_kingfisher(mouse_actions, count: int):
+    """Measure how long a kingfisher click blocks noise handling, the eyetracker moves the pointer a frame after being enabled"""
+    talon = harness.talon()
+    scheduler = harness.load("frame_scheduler").frame_scheduler
+    kingfisher = mouse_actions.KingfisherClick()
+    enable_tracker = talon.actions.user.enable_tracker_mouse
+    talon.actions.user.register("enable_tracker_mouse", lambda: scheduler.defer(0.0, lambda: talon.ctrl.mouse_move(500, 500)))
+
+    samples = []
+    start = time.perf_counter()
+    for index in range(count):
+        talon.ctrl.mouse_position = (0, 0)
+        click_start = time.perf_counter()
+        kingfisher.click(1)
+        samples.append(time.perf_counter() - click_start)
+
+        # Run the remaining stages of the pipeline outside of the measured noise handling
+        while kingfisher.busy:
+            scheduler.tick()
+    result = harness.LatencyResult("KingfisherClick.click", samples, time.perf_counter() - start)
+    talon.actions.user.register("enable_tracker_mouse", enable_tracker)
+    talon.cron.reset()
+    return result
+
+def repeat_timing(repeat_times: list, holds: list) -> str:
+    """Achieved repeat rate and the jitter of the intervals between repeats during the steady state of every hold"""
+    intervals = []
+    total = 0
+    duration = 0.0
+    for start, end in holds:
+        steady = [ts for ts in repeat_times if start + 1.0 <= ts <= end]
+        total += len(steady)
+        duration += end - start - 1.0
+        intervals.extend(b - a for a, b in zip(steady, steady[1:]))
+    mean = sum(intervals) / len(intervals) if intervals else 0.0
+    jitter = (sum((interval - mean) ** 2 for interval in intervals) / len(intervals)) ** 0.5 if intervals else 0.0
+    return f"{total / duration:5.1f} repeats/s, jitter {jitter * 1000:5.1f}ms"
+
+def bench_woodpecker_timing(woodpecker_drill, seed: int, holds: int = 20, hold_seconds: float = 3.0) -> list:
+    """Compare the steady state repeat rate and jitter of the event driven and the timed woodpecker under a loaded noise detector"""
+    talon = harness.talon()
+    rng = random.Random(seed)
+    talon.cron.lateness = lambda: rng.uniform(0.0, 0.002)
+
+    # Repeat events arrive every 10 to 40 milliseconds with occasional stalls of the noise detector
+    noise_events = []
+    hold_times = []
+    ts = 1.0
+    for hold in range(holds):
+        start = ts
+        noise_events.append((ts, "start"))
+        while ts < start + hold_seconds:
+            ts += rng.uniform(0.010, 0.040) + (0.15 if rng.random() < 0.02 else 0.0)
+            noise_events.append((ts, "repeat"))
+        noise_events.append((ts, "stop"))
+        hold_times.append((start, ts))
+        ts += 1.0
+
+    rows = []
+    try:
+        for name, repeater in (("event driven", woodpecker_drill.NoiseActionRepeater()), ("timed", woodpecker_drill.TimedNoiseActionRepeater())):
+            with harness.virtual_clock(0.0) as clock:
+                repeat_times = []
+                repeater.set_callback(lambda ts, count: repeat_times.extend([clock.time()] * count))
+                for ts, lifecycle in noise_events:
+                    talon.cron.run_until(ts, clock.set)
+                    clock.set(ts)
+                    if lifecycle == "start":
+                        repeater.start_drill(ts)
+                    elif lifecycle == "repeat":
+                        repeater.drill_update(ts)
+                    else:
+                        repeater.stop_drill(ts)
+            rows.append(f"{'Woodpecker timing [' + name + ']':<50} " + repeat_timing(repeat_times, hold_times))
+    finally:
+        talon.cron.lateness = lambda: 0.0
+    return rows
+
+def bench_profile_switching(hummingbird2, count: int, seed: int):
+    """Measure switching profiles through the voice override action while the continuous job of the slot keeps ticking"""
+    talon = harness.talon()
+    scheduler = harness.load("frame_scheduler").frame_scheduler
+    hb = hummingbird2.get_hummingbird_by_slot("primary")
+    hb.start_continuous_job()
+    hb.activate_direction("up", time.time(), "start")
+    hb.activate_direction("left", time.time(), "start")
+    profiles = ["arrows", "arrows_word", "select", "select_word", "cursor", "jira", "menu"]
+    rng = random.Random(seed)
+
+    samples = []
+    start = time.perf_counter()
+    for index in range(count):
+        profile = rng.choice(profiles)
+        switch_start = time.perf_counter()
+        talon.actions.user.hummingbird2_set(profile, "primary")
+        samples.append(time.perf_counter() - switch_start)
+        scheduler.tick()
+    result = harness.LatencyResult("hummingbird2_set while continuous", samples, time.perf_counter() - start)
+    hb.end_continuous_job()
+    hb.clear_directions("all")
+    talon.cron.reset()
+    return result
+
+def bench_noise_log(count: int):
+    """Measure logging a noise from the noise handler, flushing the log to the HUD every 100 logged noises"""
+    talon = harness.talon()
+    samples = []
+    start = time.perf_counter()
+    for index in range(count):
+        log_start = time.perf_counter()
+        talon.actions.user.add_noise_log("Stand still", "pop")
+        samples.append(time.perf_counter() - log_start)
+        if index % 100 == 99:
+            talon.cron.fire_all()
+    talon.cron.reset()
+    return harness.LatencyResult("add_noise_log", samples, time.perf_counter() - start)
+
+def bench_keybird_lookup(virtual_keybird, columns: int, regions: int, count: int, seed: int):
+    """Measure finding the key under the pointer for a grid on every screen of a two screen setup, with extra regions on top"""
+    harness.talon()
+    from talon import screen, ui
+    rng = random.Random(seed)
+    ui.screen_list[:] = [screen.Screen(0, 0, 1920, 1080), screen.Screen(1920, -200, 2560, 1440)]
+    try:
+        keybird = virtual_keybird.VirtualKeybird()
+        keybird.set_layout(virtual_keybird.KeybirdLayout(
+            [virtual_keybird.KeyGrid(columns, columns, [virtual_keybird.noop_key] * (columns * columns))],
+            [virtual_keybird.KeyRegion(f"region_{index}", virtual_keybird.noop_key, rng.random() * 0.9, rng.random() * 0.9, 0.1, 0.1, index % 2)
+                for index in range(regions)]
+        ))
+        keybird.find_key((0, 0))
+        positions = [((rng.uniform(0, 4480), rng.uniform(-200, 1240)),) for _ in range(count)]
+        return harness.measure(f"VirtualKeybird.find_key [{columns}x{columns}, {regions} regions]", positions, keybird.find_key)
+    finally:
+        ui.screen_list[:] = [screen.main]
+
+def bench_mode_switching(noise_modes, count: int, seed: int):
+    """Measure switching between random parrot modes through the switch mode, the way the noise commands do"""
+    talon = harness.talon()
+    rng = random.Random(seed)
+    modes = [mode for mode in noise_modes.parrot_modes if mode != "parrot_switch"] + [""]
+    controller = noise_modes.NoiseModeController(noise_modes.parrot_modes)
+    talon.calls.clear()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(count):
+        mode = rng.choice(modes)
+        switch_start = time.perf_counter()
+        controller.switch_with_timeout("parrot_switch")
+        controller.switch(mode)
+        samples.append(time.perf_counter() - switch_start)
+    elapsed = time.perf_counter() - start
+    controller.switch("")
+    talon.cron.reset()
+    mode_calls = talon.calls["mode.enable"] + talon.calls["mode.disable"]
+    result = harness.LatencyResult(f"noise mode switch [{mode_calls / count:.1f} mode calls]", samples, elapsed)
+    talon.calls.clear()
+    return result
+
+def bench_add_momentum(power_momentum, events: list):
+    momentum = power_momentum.PowerMomentum()
+    momentum.set_callback(lambda momentum: None)
+    momentum.start(events[0][0])
+    result = harness.measure("PowerMomentum.add_momentum", events, momentum.add_momentum)
+    momentum.stop()
+    return result
+
+def bench_momentum_job(power_momentum, count: int):
+    momentum = power_momentum.PowerMomentum()
+    momentum.set_callback(power_momentum.scroll_down)
+    momentum.start(0.0)
+
+    # Keep the momentum topped up so the job does not cancel itself halfway through
+    def tick():
+        ts = time.time()
+        if momentum.momentum_at(ts) < 10:
+            momentum.set_momentum(40.0, ts)
+        momentum.momentum_job()
+    result = harness.measure("PowerMomentum.momentum_job", [()] * count, tick)
+    momentum.stop()
+    return result
+
+def bench_drill_update(woodpecker_drill, events: list):
+    repeater = woodpecker_drill.NoiseActionRepeater()
+
+    def drill(ts, direction, lifecycle):
+        if lifecycle == "start":
+            repeater.start_drill(ts)
+        elif lifecycle == "repeat":
+            repeater.drill_update(ts)
+        else:
+            repeater.stop_drill(ts)
+    return harness.measure("NoiseActionRepeater.drill_update", events, drill)
+
+def tick_pattern(pattern: str, seconds: float, seed: int) -> list:
+    """Tick timestamps for the given pattern, emulating an idle machine or one under load"""
+    rng = random.Random(seed)
+    ts = 0.0
+    ticks = []
+    while ts < seconds:
+        if pattern == "16ms":
+            ts += 0.016
+        elif pattern == "33ms":
+            ts += 0.033
+        elif pattern == "jitter":
+            ts += rng.uniform(0.006, 0.026)
+        elif pattern == "stalls":
+            ts += 0.016 + (0.05 if rng.random() < 0.1 else 0.0)
+        ticks.append(ts)
+    return ticks
+
+def bench_cursor_speed(hummingbird2, profile: str, seconds: float, seed: int) -> str:
+    """Measure the cursor speed in pixels per second during the last second of holding a direction, for several tick patterns"""
+    talon = harness.talon()
+    moved = [0.0]
+    talon.actions.user.register("mouse_relative_move", lambda x, y: moved.__setitem__(0, moved[0] + x))
+    speeds = []
+    for pattern in ("16ms", "33ms", "jitter", "stalls"):
+        hb = new_hummingbird(hummingbird2, profile)
+        hb.activate_direction("right", 0.0, "start")
+        moved[0] = 0.0
+        mark_ts = None
+        mark_moved = 0.0
+        for ts in tick_pattern(pattern, seconds, seed):
+            hb.update_directions(ts, hummingbird2.HummingEvent.REPEAT)
+            if mark_ts is None and ts >= seconds - 1.0:
+                mark_ts = ts
+                mark_moved = moved[0]
+        speeds.append(f"{pattern} {(moved[0] - mark_moved) / (ts - mark_ts):.0f}px/s")
+        hb.activate_direction("right", seconds, "stop")
+    del talon.actions.user._registered["mouse_relative_move"]
+    return f"{'Cursor speed [' + profile + ']':<50} " + ", ".join(speeds)
+
+def bench_diagonal_rate(hummingbird2, throttler_class, throttle: float, starting_throttle: float, seconds: float = 2.0) -> str:
+    """Measure the events per second delivered on both axes while holding a diagonal and ticking every frame"""
+    throttler = throttler_class(throttle, starting_throttle)
+    delivered = {"up": 0, "left": 0}
+    ts = 0.0
+    for direction in delivered:
+        throttler.determine_event(ts, direction, hummingbird2.HummingEvent.START)
+    while ts < seconds:
+        ts += 0.016
+        for direction in delivered:
+            if throttler.determine_event(ts, direction, hummingbird2.HummingEvent.REPEAT) != hummingbird2.HummingEvent.THROTTLED:
+                delivered[direction] += 1
+    rates = ", ".join(f"{direction} {count / seconds:.1f}/s" for direction, count in delivered.items())
+    return f"{'Diagonal rate [' + throttler_class.__name__ + f' {throttle}s, {starting_throttle}s]':<50} " + rates
+
+def bench_continuous_wakeups(hummingbird2, profile: str, seconds: float = 5.0) -> str:
+    """Count the timer callbacks and dispatched actions per second while holding a direction in continuous mode"""
+    talon = harness.talon()
+    talon.calls.clear()
+    with harness.virtual_clock(1000.0) as clock:
+        hb = new_hummingbird(hummingbird2, profile)
+        dispatched = [0]
+        update_directions = hb.update_directions
+        def counted_update(ts, event):
+            count = update_directions(ts, event)
+            dispatched[0] += count
+            return count
+        hb.update_directions = counted_update
+        
+        hb.start_continuous_job()
+        hb.activate_direction("right", clock.ts, "start")
+        talon.cron.run_until(clock.ts + seconds, clock.set)
+        hb.end_continuous_job()
+        wakeups = talon.calls["cron.wakeup"]
+    return f"{'Continuous wakeups [' + profile + ']':<50} {wakeups / seconds:.1f} callbacks/s, {dispatched[0] / seconds:.1f} actions/s"
+
+def bench_charm_frames(hummingbird2, profile: str, slot_counts = (1, 4, 16, 64), frames: int = 2000) -> str:
+    """Measure the cost of a single frame of the shared frame consumer as the amount of continuously moving slots grows"""
+    scheduler = harness.load("frame_scheduler").frame_scheduler
+    costs = []
+    with harness.virtual_clock(1000.0) as clock:
+        for slot_count in slot_counts:
+            charm = hummingbird2.HummingbirdCharm()
+            for index in range(slot_count):
+                hb = charm.get(f"slot_{index}")
+                hb.set_profile(profile)
+                hb.start_continuous_job()
+                hb.activate_direction(("up", "left", "right", "down")[index % 4], clock.ts, "start")
+            
+            elapsed = 0.0
+            for frame in range(frames):
+                clock.set(clock.ts + 0.016)
+                frame_start = time.perf_counter()
+                scheduler.tick()
+                elapsed += time.perf_counter() - frame_start
+            for hb in charm.slots.values():
+                hb.end_continuous_job()
+            costs.append(f"{slot_count} slots {elapsed / frames * 1e6:.1f}us")
+    return f"{'Frame cost [' + profile + ']':<50} " + ", ".join(costs)
+
+def run(count: int, seed: int):
+    talon = harness.talon()
+    hummingbird2 = harness.load("hummingbird2")
+    power_momentum = harness.load("power_momentum")
+    woodpecker_drill = harness.load("woodpecker_drill")
+    mouse_actions = harness.load("mouse_actions")
+    virtual_keybird = harness.load("virtual_keybird")
+    noise_modes = harness.load("noise_modes")
+
+    noises = harness.noise_stream(count, seed=seed)
+    rng = random.Random(seed)
+    powers = [(ts, rng.uniform(0.0, 1.0)) for ts, direction, lifecycle in harness.noise_stream(count, seed=seed + 1)]
+
+    results = [
+        bench_activate_direction(hummingbird2, noises, "cursor"),
+        bench_activate_direction(hummingbird2, noises, "arrows"),
+        bench_activate_direction(hummingbird2, noises, "cursor_velocity"),
+        bench_tick_directions(hummingbird2, count, "cursor"),
+        bench_tick_directions(hummingbird2, count, "arrows"),
+        bench_tick_directions(hummingbird2, count, "cursor_velocity"),
+        bench_key_release(hummingbird2, min(count, 200), seed),
+        bench_profile_switching(hummingbird2, count, seed),
+        bench_kingfisher(mouse_actions, min(count, 200)),
+        bench_noise_log(count),
+        bench_mode_switching(noise_modes, count, seed),
+        bench_keybird_lookup(virtual_keybird, 3, 0, count, seed),
+        bench_keybird_lookup(virtual_keybird, 12, 20, count, seed),
+        bench_keybird_lookup(virtual_keybird, 48, 200, count, seed),
+        bench_add_momentum(power_momentum, powers),
+        bench_momentum_job(power_momentum, count),
+        bench_drill_update(woodpecker_drill, noises),
+    ]
+    print(harness.header())
+    for result in results:
+        print(result.row())
+    print(bench_cursor_speed(hummingbird2, "cursor", 2.0, seed))
+    print(bench_cursor_speed(hummingbird2, "cursor_velocity", 2.0, seed))
+    for profile in ("cursor", "cursor_velocity", "arrows", "select", "jira", "menu", "wasd"):
+        print(bench_continuous_wakeups(hummingbird2, profile))
+    print(bench_charm_frames(hummingbird2, "cursor"))
+    print(bench_charm_frames(hummingbird2, "arrows"))
+    for throttler_class in (hummingbird2.FlatThrottler, hummingbird2.DirectionalThrottler):
+        print(bench_diagonal_rate(hummingbird2, throttler_class, 0.001, 0.2))
+        print(bench_diagonal_rate(hummingbird2, throttler_class, 0.1, 0.3))
+    for row in bench_woodpecker_timing(woodpecker_drill, seed):
+        print(row)
+    talon.cron.reset()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the noise handling hot paths")
+    parser.add_argument("--events", type=int, default=20000, help="Amount of events per benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic noise streams")
+    args = parser.parse_args()
+    run(args.events, args.seed)
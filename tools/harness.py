@@ -0,0 +1,131 @@
+"""Loads the pandemonium scripts outside of Talon using the stand-in from tools/stubs
+
+Nothing in here runs on import, so Talon can safely load this directory along with the rest of the scripts
+"""
+import importlib
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+PACKAGE = "pandemonium"
+
+def install():
+    """Make the talon stand-in importable and expose the repository as a package"""
+    if STUBS not in sys.path:
+        sys.path.insert(0, STUBS)
+
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [ROOT]
+        sys.modules[PACKAGE] = package
+
+        # Keep the learned noise durations of the user out of the measurements, and the measurements out of their file
+        noise_durations = importlib.import_module(PACKAGE + ".noise_durations").noise_durations
+        noise_durations.clear()
+        noise_durations.path = os.path.join(tempfile.gettempdir(), "pandemonium_noise_durations.json")
+
+def load(name: str):
+    """Import one of the scripts, for example load("hummingbird2")"""
+    install()
+    return importlib.import_module(PACKAGE + "." + name)
+
+def talon():
+    install()
+    return importlib.import_module("talon")
+
+class VirtualClock:
+    """Clock that only moves forward when the replay tells it to"""
+    ts: float
+
+    def __init__(self, ts: float = 0.0):
+        self.ts = ts
+
+    def time(self) -> float:
+        return self.ts
+
+    def set(self, ts: float):
+        self.ts = max(self.ts, ts)
+
+@contextmanager
+def virtual_clock(ts: float = 0.0) -> Iterator[VirtualClock]:
+    """Run the scripts and the cron stand-in against a virtual clock, restoring the real clock and dropping the jobs afterwards"""
+    cron = talon().cron
+    clock_module = load("clock")
+    clock = VirtualClock(ts)
+    clock_module.set_time_source(clock.time)
+    cron.time_source = clock.time
+    cron.reset()
+    try:
+        yield clock
+    finally:
+        clock_module.set_time_source(time.time)
+        cron.time_source = time.time
+        cron.reset()
+
+# Synthetic noise streams
+# Every event is a tuple of ( ts, direction, lifecycle ) just like the parrot integration sends them
+NoiseEvent = Tuple[float, str, str]
+
+def noise_stream(count: int, directions=("up", "left", "right", "down"), seed: int = 0, start_ts: float = 1000.0,
+    repeat_interval: float = 0.016, tap_ratio: float = 0.3) -> List[NoiseEvent]:
+    """Generate a stream of start, repeat and stop events with a mix of short taps and long holds"""
+    rng = random.Random(seed)
+    events = []
+    ts = start_ts
+    while len(events) < count:
+        direction = rng.choice(directions)
+        duration = rng.uniform(0.04, 0.15) if rng.random() < tap_ratio else rng.uniform(0.3, 1.5)
+        end = ts + duration
+        events.append((ts, direction, "start"))
+        ts += repeat_interval * rng.uniform(0.7, 1.3)
+        while ts < end and len(events) < count - 1:
+            events.append((ts, direction, "repeat"))
+            ts += repeat_interval * rng.uniform(0.7, 1.3)
+        events.append((end, direction, "stop"))
+        ts = end + rng.uniform(0.05, 0.4)
+    return events[:count]
+
+# Measurement helpers
+def percentile(sorted_samples: List[float], p: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(p / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+class LatencyResult:
+    name: str
+    samples: List[float]
+    elapsed: float
+
+    def __init__(self, name: str, samples: List[float], elapsed: float):
+        self.name = name
+        self.samples = sorted(samples)
+        self.elapsed = elapsed
+
+    def events_per_second(self) -> float:
+        return len(self.samples) / self.elapsed if self.elapsed > 0 else 0.0
+
+    def row(self) -> str:
+        us = lambda p: percentile(self.samples, p) * 1_000_000
+        return f"{self.name:<50} {len(self.samples):>8} {self.events_per_second():>12,.0f} {us(50):>8.2f} {us(90):>8.2f} {us(99):>8.2f} {us(100):>9.2f}"
+
+def header() -> str:
+    return f"{'benchmark':<50} {'events':>8} {'events/s':>12} {'p50 us':>8} {'p90 us':>8} {'p99 us':>8} {'max us':>9}"
+
+def measure(name: str, events: list, handler: Callable) -> LatencyResult:
+    """Time each call to the handler with one of the events as its arguments"""
+    samples = [0.0] * len(events)
+    clock = time.perf_counter
+    start = clock()
+    for index, event in enumerate(events):
+        event_start = clock()
+        handler(*event)
+        samples[index] = clock() - event_start
+    return LatencyResult(name, samples, clock() - start)
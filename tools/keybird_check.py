@@ -0,0 +1,51 @@
+"""Exhaustive check of the virtual keybird key lookup over every integer pixel of a screen
+
+Every pixel should resolve to the grid cell that contains it, no pixel on a cell boundary may fall through to noop_key
+Run from the repository root with
+    python -m tools.keybird_check [--width 2560] [--height 1440]
+"""
+import argparse
+import sys
+from collections import Counter
+from . import harness
+
+# Grid sizes whose cell sizes are not whole pixels on common screen sizes
+AWKWARD_GRIDS = ((3, 3), (7, 7), (13, 9), (35, 35), (48, 27))
+
+def indexed_key(index: int):
+    def key(ts: float):
+        pass
+    key.index = index
+    return key
+
+def check_grid(virtual_keybird, columns: int, rows: int, width: int, height: int) -> Counter:
+    """Count the pixels that resolve to no key or to the key of another cell"""
+    keys = [indexed_key(index) for index in range(columns * rows)]
+    lookup = virtual_keybird.KeyLookup(virtual_keybird.KeybirdLayout([virtual_keybird.KeyGrid(columns, rows, keys)]), ((0, 0, width, height),))
+    errors = Counter()
+    for y in range(height):
+        row = y * rows // height
+        for x in range(width):
+            key = lookup.find_key(x, y)
+            if key is virtual_keybird.noop_key:
+                errors["unmapped pixels"] += 1
+            elif key.index != row * columns + x * columns // width:
+                errors["pixels in the wrong cell"] += 1
+    return errors
+
+def run(width: int, height: int) -> bool:
+    harness.talon()
+    virtual_keybird = harness.load("virtual_keybird")
+    errors = Counter()
+    for columns, rows in AWKWARD_GRIDS:
+        grid_errors = check_grid(virtual_keybird, columns, rows, width, height)
+        print(f"{columns}x{rows} grid on {width}x{height}: " + (", ".join(f"{name} {count}" for name, count in sorted(grid_errors.items())) or "ok"))
+        errors.update(grid_errors)
+    return sum(errors.values()) == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the virtual keybird lookup against every pixel of a screen")
+    parser.add_argument("--width", type=int, default=2560, help="Width of the screen in pixels")
+    parser.add_argument("--height", type=int, default=1440, help="Height of the screen in pixels")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.width, args.height) else 1)
@@ -0,0 +1,116 @@
+"""Replays a recorded noise trace against a virtual clock and the talon stand-in
+
+Traces are recorded in Talon with user.noise_recorder_start() and user.noise_recorder_stop()
+Run from the repository root with
+    python -m tools.replay recordings/<trace>.jsonl
+    python -m tools.replay --synthesize 600 recordings/synthetic.jsonl
+"""
+import argparse
+import json
+import os
+import time
+from typing import List, Tuple
+from . import harness
+
+TraceEvent = Tuple[float, str, list]
+
+def load_trace(path: str) -> List[TraceEvent]:
+    with open(path, "r", encoding="utf-8") as trace:
+        return [tuple(json.loads(line)) for line in trace if line.strip()]
+
+def save_trace(path: str, events: List[TraceEvent]):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as trace:
+        for event in events:
+            trace.write(json.dumps(event) + "\n")
+
+def synthesize(seconds: float, seed: int = 0) -> List[TraceEvent]:
+    """Generate a trace of continuous hummingbird movement and momentum scrolling lasting the given amount of seconds"""
+    events = [(0.0, "hummingbird2_set", ["cursor", ""]), (0.0, "hummingbird2_continuous", [""]), (0.0, "power_momentum_scroll_down", [])]
+    noises = harness.noise_stream(int(seconds * 60), seed=seed, start_ts=0.0, repeat_interval=0.02)
+    scroll_noises = harness.noise_stream(int(seconds * 20), directions=("shush",), seed=seed + 1, start_ts=0.0, repeat_interval=0.02)
+
+    for ts, direction, lifecycle in noises:
+        if ts < seconds:
+            events.append((ts, "hummingbird2_" + direction, [ts, lifecycle, ""]))
+            
+            # Continuous mode ignores the stop events, so clear the direction like a pop would
+            if lifecycle == "stop":
+                events.append((ts, "hummingbird2_clear", ["all", ""]))
+    for ts, direction, lifecycle in scroll_noises:
+        if ts < seconds:
+            if lifecycle == "start":
+                events.append((ts, "power_momentum_start", [ts, 2.0]))
+                events.append((ts, "woodpecker_start", [ts]))
+            elif lifecycle == "repeat":
+                events.append((ts, "power_momentum_add", [ts, 0.5]))
+                events.append((ts, "woodpecker_drill", [ts]))
+            else:
+                events.append((ts, "power_momentum_decaying", []))
+                events.append((ts, "woodpecker_stop", [ts]))
+    events.sort(key=lambda event: event[0])
+    return events
+
+def replay(events: List[TraceEvent], tail: float = 2.0, latency_path: str = "") -> dict:
+    """Feed the trace through the action classes, firing the cron jobs that would have run in between"""
+    talon = harness.talon()
+    scheduler = harness.load("frame_scheduler").frame_scheduler
+    output = harness.load("output_buffer").output_buffer
+    hud = harness.load("hummingbird2").hud_ability_queue
+    latency = harness.load("noise_latency").noise_latency
+    for name in ("hummingbird2", "power_momentum", "woodpecker_drill"):
+        harness.load(name)
+
+    talon.calls.clear()
+    scheduler.reset_tick_counts()
+    output.reset_call_counts()
+    hud.reset_render_counts()
+    latency.clear()
+    latency.enabled = latency_path != ""
+
+    start = time.perf_counter()
+    try:
+        with harness.virtual_clock(events[0][0] if events else 0.0) as clock:
+            for ts, action, args in events:
+                talon.cron.run_until(ts, clock.set)
+                clock.set(ts)
+                getattr(talon.actions.user, action)(*args)
+            talon.cron.run_until(clock.ts + tail, clock.set)
+            if latency.enabled:
+                latency.dump(latency_path)
+    finally:
+        latency.enabled = False
+
+    return {
+        "events": len(events),
+        "session_seconds": (events[-1][0] - events[0][0]) if events else 0.0,
+        "replay_seconds": time.perf_counter() - start,
+        "calls": dict(talon.calls),
+        "useful_ticks": scheduler.useful_ticks,
+        "wasted_ticks": scheduler.wasted_ticks,
+        "requested_calls": output.requested_calls,
+        "saved_calls": output.saved_calls(),
+        "hud_renders": hud.renders,
+        "suppressed_hud_renders": hud.suppressed_renders(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded noise trace against a virtual clock")
+    parser.add_argument("trace", help="Path to the JSONL trace")
+    parser.add_argument("--synthesize", type=float, default=0, help="Write a synthetic trace of this many seconds to the path first")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic trace")
+    parser.add_argument("--latency", default="", help="Write the noise to action latency histograms of the replay to this JSON file")
+    args = parser.parse_args()
+
+    if args.synthesize > 0:
+        save_trace(args.trace, synthesize(args.synthesize, args.seed))
+
+    result = replay(load_trace(args.trace), latency_path=args.latency)
+    print(f"Replayed {result['events']} events covering {result['session_seconds']:.1f}s of session in {result['replay_seconds']:.3f}s")
+    print(f"Frame ticks - useful: {result['useful_ticks']}, wasted: {result['wasted_ticks']}")
+    print(f"Output calls - requested: {result['requested_calls']}, saved by buffering: {result['saved_calls']}")
+    print(f"HUD renders: {result['hud_renders']}, suppressed: {result['suppressed_hud_renders']}")
+    for name, count in sorted(result["calls"].items()):
+        print(f"    {name:<32} {count:>8}")
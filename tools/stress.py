@@ -0,0 +1,170 @@
+"""Multi-threaded stress test for the state changes of the HummingBird slots
+
+Several threads send noise events to a few shared slots as fast as they can while another thread runs the frame clock
+Every direction of a slot should see its START and STOP actions strictly alternate, and every submitted noise should be applied once
+Once every slot has stopped, no output batch, ticking slot, frame consumer or timer should be left behind
+Run from the repository root with
+    python -m tools.stress [--threads 4] [--slots 3] [--events 20000] [--seed 0]
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from . import harness
+
+def recording_action(hummingbird2, output_buffer, log: list, slot: str, direction: str):
+    def action(ts, event):
+        if event in (hummingbird2.HummingEvent.START, hummingbird2.HummingEvent.STOP):
+            log.append((slot, direction, event))
+        if event != hummingbird2.HummingEvent.STOP:
+            output_buffer.mouse_move(1, 0)
+    return action
+
+def sleepy_throttler(hummingbird2):
+    class SleepyThrottler(hummingbird2.InputThrottler):
+        """Never throttles, but makes the continuous job sleep a few frames after every tick so it is woken up by a deferred callback"""
+        
+        def next_due(self, ts: float, direction: str) -> float:
+            return ts + 0.05
+    return SleepyThrottler()
+
+def yielding_cron(talon):
+    """Give up the rest of the time slice whenever a timer is created or cancelled, like a busy machine would, to widen the windows for races"""
+    schedule = talon.cron.schedule
+    cancel = talon.cron.cancel
+    def yielding_schedule(interval: str, cb, repeat: bool):
+        time.sleep(0)
+        return schedule(interval, cb, repeat)
+    def yielding_cancel(job):
+        time.sleep(0)
+        cancel(job)
+    talon.cron.schedule = yielding_schedule
+    talon.cron.cancel = yielding_cancel
+    return schedule, cancel
+
+def check_alternation(hummingbird2, log: list) -> Counter:
+    """Count the START and STOP actions that did not alternate per direction of a slot"""
+    errors = Counter()
+    started = {}
+    for slot, direction, event in log:
+        if event == hummingbird2.HummingEvent.START:
+            if started.get((slot, direction), False):
+                errors["duplicated START"] += 1
+            started[(slot, direction)] = True
+        else:
+            if not started.get((slot, direction), False):
+                errors["duplicated STOP"] += 1
+            started[(slot, direction)] = False
+    errors["lost STOP"] += sum(started.values())
+    return errors
+
+def counted_apply_direction(applied: Counter, apply_direction):
+    def apply(new_direction, ts, lifecycle):
+        applied[threading.current_thread().name] += 1
+        apply_direction(new_direction, ts, lifecycle)
+    return apply
+
+def check_shared_state(talon, scheduler, output_buffer, charm) -> Counter:
+    """Count the shared state that was left behind after every slot has stopped"""
+    errors = Counter()
+    errors["open output batches"] = output_buffer.open_batches()
+    errors["slots left ticking"] = len(charm.ticking)
+    errors["charm left subscribed"] = int(scheduler.is_subscribed(charm.tick))
+    errors["frame clock left running"] = int(scheduler.job is not None)
+    errors["orphaned interval jobs"] = sum(1 for due, interval, cb, repeat in talon.cron.jobs.values() if repeat)
+    return errors
+
+def run(threads: int, slots: int, events: int, seed: int) -> bool:
+    talon = harness.talon()
+    hummingbird2 = harness.load("hummingbird2")
+    scheduler = harness.load("frame_scheduler").frame_scheduler
+    output_buffer = harness.load("output_buffer").output_buffer
+    talon.cron.reset()
+    schedule, cancel = yielding_cron(talon)
+    
+    # The slots continuously move and sleep between actions, so they start and stop ticking from both the noise and the frame threads
+    log = []
+    applied = Counter()
+    charm = hummingbird2.HummingbirdCharm()
+    hummingbirds = []
+    for index in range(slots):
+        slot = f"stress-{index}"
+        hb = charm.get(slot)
+        hb.set_direction_actions(hummingbird2.DirectionActions(
+            *[recording_action(hummingbird2, output_buffer, log, slot, direction) for direction in hummingbird2.DIRECTIONS],
+            sleepy_throttler(hummingbird2)
+        ), "stress")
+        hb.start_continuous_job()
+        hb.apply_direction = counted_apply_direction(applied, hb.apply_direction)
+        hummingbirds.append(hb)
+
+    running = True
+    ticks = [0]
+    def tick():
+        while running:
+            scheduler.tick()
+            ticks[0] += 1
+            time.sleep(0.001)
+
+    sent = [0] * threads
+    def noise(index: int):
+        rng = random.Random(seed + index)
+        for _ in range(events):
+            hb = rng.choice(hummingbirds)
+            if rng.random() < 0.05:
+                hb.clear_directions("all")
+            else:
+                sent[index] += 1
+                hb.activate_direction(rng.choice(hummingbird2.DIRECTIONS), time.time(), rng.choice(("start", "repeat", "stop")))
+
+    # Switch threads as often as possible to provoke interleavings
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        ticker = threading.Thread(target=tick, name="ticker")
+        noise_threads = [threading.Thread(target=noise, args=(index,), name=f"noise-{index}") for index in range(threads)]
+        start = time.perf_counter()
+        ticker.start()
+        for thread in noise_threads:
+            thread.start()
+        for thread in noise_threads:
+            thread.join()
+        running = False
+        ticker.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.setswitchinterval(switch_interval)
+        talon.cron.schedule = schedule
+        talon.cron.cancel = cancel
+
+    # Stop the slots and let the frame clock run the wakeups that were still deferred
+    for hb in hummingbirds:
+        hb.clear_directions("all")
+        hb.end_continuous_job()
+    time.sleep(0.1)
+    scheduler.tick()
+    
+    submitted = threads * events
+    errors = check_alternation(hummingbird2, log)
+    errors["lost or duplicated noises"] = abs(sum(sent) - sum(applied.values()))
+    errors["unapplied changes"] = sum(len(hb.changes) for hb in hummingbirds)
+    errors.update(check_shared_state(talon, scheduler, output_buffer, charm))
+    talon.cron.reset()
+
+    print(f"Sent {submitted} noises from {threads} threads to {slots} slots and ticked {ticks[0]} frames in {elapsed:.2f}s")
+    print(f"Applied per thread: " + ", ".join(f"{name} {count}" for name, count in sorted(applied.items())))
+    print(f"START/STOP actions: {len(log)}, output calls - requested: {output_buffer.requested_calls}, issued: {output_buffer.issued_calls}")
+    for name, count in sorted(errors.items()):
+        print(f"    {name:<32} {count:>8}")
+    return sum(errors.values()) == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stress the hummingbird state changes from several threads")
+    parser.add_argument("--threads", type=int, default=4, help="Amount of threads sending noises")
+    parser.add_argument("--slots", type=int, default=3, help="Amount of hummingbird slots the noises are spread over")
+    parser.add_argument("--events", type=int, default=20000, help="Amount of noises per thread")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the noises")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.threads, args.slots, args.events, args.seed) else 1)
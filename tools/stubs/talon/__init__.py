@@ -0,0 +1,159 @@
+"""Headless stand-in for the parts of the talon API used by these scripts
+
+Only meant for running benchmarks and tooling outside of a live Talon install,
+every action call is counted so the amount of output can be inspected afterwards
+"""
+from collections import Counter
+import time
+
+calls = Counter()
+
+class ActionNamespace:
+    """Namespace that resolves registered actions and turns everything else into a counted no-op"""
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._registered = {}
+        
+    def register(self, name: str, fn):
+        self._registered[name] = fn
+        
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._registered:
+            return self._registered[name]
+        
+        path = self._name + "." + name
+        def action(*args, **kwargs):
+            calls[path] += 1
+        return action
+
+class Actions(ActionNamespace):
+    
+    def __init__(self):
+        super().__init__("")
+        self.user = ActionNamespace("user")
+        self.edit = ActionNamespace("edit")
+        self.app = ActionNamespace("app")
+        self.core = ActionNamespace("core")
+        self.mode = ActionNamespace("mode")
+        self.speech = ActionNamespace("speech")
+        
+    def key(self, key: str):
+        calls["key"] += 1
+        
+    def sleep(self, duration):
+        calls["sleep"] += 1
+        if isinstance(duration, str):
+            duration = float(duration[:-2]) / 1000 if duration.endswith("ms") else float(duration.rstrip("s"))
+        time.sleep(duration)
+
+actions = Actions()
+
+class Cron:
+    """Keeps track of the scheduled jobs so they can be fired by hand or against a virtual clock"""
+    
+    def __init__(self):
+        self.jobs = {}
+        self.job_id = 0
+        self.time_source = time.time
+        
+        # Returns how late a job fires in seconds, which allows emulating the timer precision of a busy machine
+        self.lateness = lambda: 0.0
+        
+    def schedule(self, interval: str, cb, repeat: bool):
+        self.job_id += 1
+        seconds = parse_interval(interval)
+        self.jobs[self.job_id] = [self.time_source() + seconds + self.lateness(), seconds, cb, repeat]
+        return self.job_id
+    
+    def interval(self, interval: str, cb):
+        return self.schedule(interval, cb, True)
+        
+    def after(self, interval: str, cb):
+        return self.schedule(interval, cb, False)
+        
+    def cancel(self, job):
+        self.jobs.pop(job, None)
+    
+    def fire_all(self):
+        """Run every scheduled job once, removing the one-shot jobs"""
+        for job, (due, interval, cb, repeat) in list(self.jobs.items()):
+            if job in self.jobs:
+                if not repeat:
+                    del self.jobs[job]
+                cb()
+                
+    def run_until(self, ts: float, set_time=None):
+        """Fire all the jobs that are due up until the given time in order, setting the virtual time to each due moment"""
+        while self.jobs:
+            job, (due, interval, cb, repeat) = min(self.jobs.items(), key=lambda item: item[1][0])
+            if due > ts:
+                break
+                
+            if set_time is not None:
+                set_time(due)
+            if repeat:
+                self.jobs[job][0] = due + max(interval, 0.001) + self.lateness()
+            else:
+                del self.jobs[job]
+            calls["cron.wakeup"] += 1
+            cb()
+    
+    def reset(self):
+        self.jobs.clear()
+
+def parse_interval(interval: str) -> float:
+    if interval.endswith("ms"):
+        return float(interval[:-2]) / 1000
+    elif interval.endswith("s"):
+        return float(interval[:-1])
+    return float(interval)
+
+cron = Cron()
+
+class Ctrl:
+    mouse_position = (0, 0)
+
+    def mouse_pos(self):
+        calls["ctrl.mouse_pos"] += 1
+        return self.mouse_position
+        
+    def mouse_move(self, x, y):
+        calls["ctrl.mouse_move"] += 1
+        self.mouse_position = (x, y)
+        
+    def mouse_click(self, button=0, down=False, up=False, times=1):
+        calls["ctrl.mouse_click"] += 1
+        
+    def mouse_scroll(self, y=0, x=0, by_lines=False):
+        calls["ctrl.mouse_scroll"] += 1
+        
+ctrl = Ctrl()
+
+class Module:
+
+    def tag(self, name: str, desc: str = None):
+        pass
+
+    def mode(self, name: str, desc: str = None):
+        pass
+        
+    def setting(self, name: str, type=None, default=None, desc: str = None):
+        pass
+
+    def action_class(self, cls):
+        for name, fn in vars(cls).items():
+            if callable(fn) and not name.startswith("_"):
+                actions.user.register(name, fn)
+        return cls
+
+class Context:
+    matches = ""
+    tags = []
+    settings = {}
+    lists = {}
+    
+    def action_class(self, path: str):
+        return lambda cls: cls
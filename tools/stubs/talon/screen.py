@@ -0,0 +1,12 @@
+class Screen:
+    
+    def __init__(self, x: float = 0, y: float = 0, width: float = 1920, height: float = 1080):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+main = Screen()
+
+def main_screen() -> Screen:
+    return main
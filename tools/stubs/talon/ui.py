@@ -0,0 +1,20 @@
+from typing import Callable, Dict, List
+from .screen import Screen, main
+
+# Screens can be replaced to emulate a change of resolution or monitors, call emit("screen_change") afterwards
+screen_list: List[Screen] = [main]
+callbacks: Dict[str, List[Callable]] = {}
+
+def screens() -> List[Screen]:
+    return list(screen_list)
+
+def register(event: str, callback: Callable):
+    callbacks.setdefault(event, []).append(callback)
+
+def unregister(event: str, callback: Callable):
+    if callback in callbacks.get(event, []):
+        callbacks[event].remove(callback)
+
+def emit(event: str, *args):
+    for callback in callbacks.get(event, [])[:]:
+        callback(*args)
@@ -0,0 +1,7 @@
+config = None
+
+def toggle_camera_overlay(state: bool = None):
+    pass
+    
+def toggle_control(state: bool = None):
+    pass
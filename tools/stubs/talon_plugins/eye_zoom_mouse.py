@@ -0,0 +1,2 @@
+def toggle_zoom_mouse(state: bool = None):
+    pass
@@ -0,0 +1,413 @@
+"""Offline tuner for the throttler and momentum parameters over recorded noise traces
+
+Every configuration of a parameter grid is simulated at once, with the state of the throttler and momentum kept in NumPy arrays
+Traces are recorded in Talon with user.noise_recorder_start() and user.noise_recorder_stop()
+Run from the repository root with
+    python -m tools.tuner recordings/<trace>.jsonl [--tap-max 0.15] [--top 10] [--verify 20]
+    python -m tools.tuner --synthesize 600
+"""
+import argparse
+import math
+import random
+import time
+from typing import List, Tuple
+import numpy as np
+from . import harness
+from .replay import load_trace, synthesize
+
+# Event values matching HummingEvent
+DISCRETE = 0
+START = 1
+REPEAT = 2
+STOP = 3
+THROTTLED = 4
+
+LIFECYCLES = {"start": START, "repeat": REPEAT, "stop": STOP}
+DIRECTIONS = ("up", "left", "right", "down")
+
+# Every noise event is a tuple of ( ts, direction index, event )
+NoiseEvent = Tuple[float, int, int]
+
+# Every momentum event is a tuple of ( ts, kind, power )
+MomentumEvent = Tuple[float, str, float]
+
+def hummingbird_noises(events: list) -> List[NoiseEvent]:
+    """Extract the directional noises from a trace, ignoring the frame ticks of continuous mode"""
+    noises = []
+    for ts, action, args in events:
+        if action.startswith("hummingbird2_") and action[len("hummingbird2_"):] in DIRECTIONS:
+            lifecycle = args[1] if len(args) > 1 else "stop"
+            noises.append((args[0], DIRECTIONS.index(action[len("hummingbird2_"):]), LIFECYCLES[lifecycle]))
+    return noises
+
+def momentum_events(events: list) -> List[MomentumEvent]:
+    """Extract the momentum noises from a trace, events without a timestamp argument use the recorded time"""
+    kinds = {"power_momentum_start": "start", "power_momentum_add": "add", "power_momentum_decaying": "decay", "power_momentum_stop": "stop"}
+    momentum = []
+    for ts, action, args in events:
+        if action in kinds:
+            kind = kinds[action]
+            momentum.append((args[0] if kind in ("start", "add") else ts, kind, args[1] if kind == "add" else 0.0))
+    return momentum
+
+class FlatThrottlerGrid:
+    """FlatThrottler.determine_event evaluated for every throttle and starting throttle pair of the grid at once"""
+
+    def __init__(self, throttle: np.ndarray, starting_throttle: np.ndarray):
+        self.throttle = throttle
+        self.starting_throttle = starting_throttle
+        self.clear()
+
+    def clear(self):
+        size = len(self.throttle)
+        self.last_action = np.zeros(size)
+        self.direction_start = np.zeros(size)
+        self.direction_stop = np.zeros(size)
+        self.last_duration = np.zeros(size)
+        self.started = np.zeros(size, dtype=bool)
+
+    def determine_event(self, ts: float, direction: str, event: int) -> np.ndarray:
+        delayed = self.starting_throttle > 0
+        if event == START:
+            reset = (self.last_duration < self.starting_throttle) | (ts - self.direction_stop > self.starting_throttle)
+            self.direction_start = np.where(reset, ts, self.direction_start)
+            self.last_action = np.where(reset, ts, self.last_action)
+            self.started |= reset & ~delayed
+
+            # Without a starting throttle, a start that does not reset falls through to the regular throttle checks
+            result = self.repeat(ts, START, ~reset & ~delayed)
+            result[reset & ~delayed] = START
+            result[delayed] = THROTTLED
+            return result
+
+        elif event == STOP:
+            self.started[:] = False
+            self.direction_stop[:] = ts
+            self.last_duration = ts - self.direction_start
+            return np.where(delayed & (ts - self.direction_start <= self.starting_throttle), DISCRETE, STOP)
+
+        return self.repeat(ts, event, np.ones(len(self.throttle), dtype=bool))
+
+    def repeat(self, ts: float, event: int, mask: np.ndarray) -> np.ndarray:
+        throttled = ((self.last_action + self.throttle > ts) & (self.throttle > 0)) | (ts - self.direction_start < self.starting_throttle)
+        passed = mask & ~throttled
+
+        # Passing the throttle checks implies the starting throttle has passed, so the first pass is promoted to a start
+        promoted = passed & ~self.started
+        self.last_action = np.where(passed, ts, self.last_action)
+        self.started |= promoted
+        return np.where(throttled, THROTTLED, np.where(promoted, START, event))
+
+class ThrottlerAdapter:
+    """Runs a single instance of the throttler classes of the scripts with the same interface as the grid"""
+
+    def __init__(self, throttler, events):
+        self.throttler = throttler
+        self.events = events
+
+    def determine_event(self, ts: float, direction: str, event: int) -> np.ndarray:
+        return np.array([self.throttler.determine_event(ts, direction, self.events(event)).value])
+
+def evaluate_throttler(noises: List[NoiseEvent], throttler, size: int, tap_max: float) -> dict:
+    """Count the misfires, start latency and repeat rate of every configuration
+
+    Noises shorter than tap_max are meant as discrete taps, a tap misfires when it starts a continuous action
+    Longer noises are meant as holds, a hold misfires when it never starts a continuous action
+    """
+    noise_start = [0.0] * len(DIRECTIONS)
+    first_start = np.zeros((len(DIRECTIONS), size))
+    passed = np.zeros((len(DIRECTIONS), size))
+    tap_misfires = np.zeros(size)
+    hold_misfires = np.zeros(size)
+    latency = np.zeros(size)
+    started_holds = np.zeros(size)
+    hold_seconds = 0.0
+    hold_repeats = np.zeros(size)
+
+    for ts, direction, event in noises:
+        result = throttler.determine_event(ts, DIRECTIONS[direction], event)
+        if event == START:
+            noise_start[direction] = ts
+            first_start[direction] = np.where(result == START, ts, np.nan)
+            passed[direction] = result == START
+            continue
+
+        newly_started = (result == START) & np.isnan(first_start[direction])
+        first_start[direction] = np.where(newly_started, ts, first_start[direction])
+        passed[direction] += (result == START) | (result == REPEAT)
+        if event == STOP:
+            started = ~np.isnan(first_start[direction])
+            if ts - noise_start[direction] < tap_max:
+                tap_misfires += started | (result == STOP)
+            else:
+                hold_misfires += ~started
+                latency += np.where(started, first_start[direction] - noise_start[direction], 0.0)
+                started_holds += started
+                hold_seconds += ts - noise_start[direction]
+                hold_repeats += passed[direction]
+
+    return {
+        "tap_misfires": tap_misfires,
+        "hold_misfires": hold_misfires,
+        "start_latency_ms": 1000 * latency / np.maximum(started_holds, 1),
+        "repeats_per_second": hold_repeats / max(hold_seconds, 1e-9),
+    }
+
+class MomentumGrid:
+    """PowerMomentum evaluated for every power scaling and decay pair of the grid at once"""
+
+    def __init__(self, power_scaling: np.ndarray, decay: np.ndarray, decay_interval: float):
+        self.power_scaling = power_scaling
+        self.decay_rate = -np.log(decay) / decay_interval
+        self.momentum = np.full(len(power_scaling), 0.1)
+        self.momentum_ts = np.zeros(len(power_scaling))
+        self.starting_ts = np.zeros(len(power_scaling))
+        self.increasing = np.ones(len(power_scaling), dtype=bool)
+
+    def momentum_at(self, ts: float) -> np.ndarray:
+        elapsed = ts - self.momentum_ts
+        decayed = self.momentum * np.exp(-self.decay_rate * np.maximum(elapsed, 0.0))
+        return np.where((elapsed <= 0) | (self.momentum == 0.0), self.momentum, decayed)
+
+    def start(self, ts: float):
+        self.starting_ts[:] = ts
+        self.increasing[:] = True
+        self.momentum = np.maximum(0.1, self.momentum_at(ts))
+        self.momentum_ts[:] = ts
+
+    def add(self, ts: float, power: float):
+        duration_ms = (ts - self.starting_ts) * 1000
+        momentum = self.momentum_at(ts)
+        momentum += np.where(duration_ms / 130 < 1, power * self.power_scaling / 2,
+            (power * self.power_scaling / 5) * np.sqrt(np.maximum(duration_ms, 0.0) / 100))
+        self.momentum = momentum
+        self.momentum_ts[:] = ts
+
+    def decay(self, ts: float):
+        self.starting_ts[:] = 0
+        self.increasing[:] = False
+
+    def stop(self, ts: float):
+        self.momentum = np.zeros(len(self.momentum))
+        self.momentum_ts[:] = ts
+        self.increasing[:] = False
+
+    def tail(self, from_ts: float, to_ts: float, idle: float, decay_interval: float) -> np.ndarray:
+        """Scroll ticks sent between the two timestamps while decaying, the momentum is zeroed once it drops below idle"""
+        momentum = self.momentum_at(from_ts)
+        natural_end = np.log(np.maximum(momentum, idle) / idle) / self.decay_rate
+        window = np.minimum(natural_end, to_ts - from_ts)
+        scroll = momentum * (1 - np.exp(-self.decay_rate * window)) / self.decay_rate / (20 * decay_interval)
+        self.momentum = np.where(natural_end <= to_ts - from_ts, 0.0, self.momentum)
+        return scroll
+
+class MomentumAdapter:
+    """Runs a single PowerMomentum instance of the scripts with the same interface as the grid
+
+    The decay tail is sampled every frame like the momentum job does, rather than integrated
+    """
+
+    def __init__(self, power_momentum, idle: float):
+        self.power_momentum = power_momentum
+        self.idle = idle
+
+    @property
+    def momentum(self) -> np.ndarray:
+        return np.array([self.power_momentum.momentum])
+
+    def start(self, ts: float):
+        self.power_momentum.starting_ts = ts
+        self.power_momentum.momentum_increasing = True
+        self.power_momentum.set_momentum(max(0.1, self.power_momentum.momentum_at(ts)), ts)
+
+    def add(self, ts: float, power: float):
+        self.power_momentum.add_momentum(ts, power)
+
+    def decay(self, ts: float):
+        self.power_momentum.mark_decay()
+
+    def stop(self, ts: float):
+        self.power_momentum.set_momentum(0, ts)
+        self.power_momentum.momentum_increasing = False
+
+    def tail(self, from_ts: float, to_ts: float, idle: float, decay_interval: float) -> np.ndarray:
+        scroll = 0.0
+        ts = from_ts + decay_interval
+        while ts < to_ts:
+            momentum = self.power_momentum.momentum_at(ts)
+            if momentum < idle:
+                self.power_momentum.set_momentum(0, ts)
+                break
+            scroll += momentum / 20
+            ts += decay_interval
+        return np.array([scroll])
+
+def evaluate_momentum(events: List[MomentumEvent], momentum, size: int, idle: float, decay_interval: float) -> dict:
+    """Measure the time until the momentum becomes noticeable after a start, and the scrolling that happens after the noise has ended"""
+    latency = np.zeros(size)
+    reached_count = np.zeros(size)
+    stalls = np.zeros(size)
+    overshoot = np.zeros(size)
+    episodes = 0
+    episode_start = 0.0
+    reached = np.zeros(size, dtype=bool)
+    decay_ts = None
+
+    for ts, kind, power in events:
+        if decay_ts is not None:
+            overshoot += momentum.tail(decay_ts, ts, idle, decay_interval)
+            decay_ts = None
+
+        if kind == "start":
+            momentum.start(ts)
+            episodes += 1
+            episode_start = ts
+            reached = momentum.momentum >= idle
+        elif kind == "add":
+            momentum.add(ts, power)
+            newly_reached = ~reached & (momentum.momentum >= idle)
+            latency += np.where(newly_reached, ts - episode_start, 0.0)
+            reached |= newly_reached
+        elif kind == "decay":
+            momentum.decay(ts)
+            decay_ts = ts
+            reached_count += reached
+            stalls += ~reached
+        else:
+            momentum.stop(ts)
+
+    if decay_ts is not None:
+        overshoot += momentum.tail(decay_ts, decay_ts + 60.0, idle, decay_interval)
+
+    return {
+        "start_latency_ms": 1000 * latency / np.maximum(reached_count, 1),
+        "stalls": stalls,
+        "overshoot_ticks": overshoot / max(episodes, 1),
+    }
+
+def throttler_grid(throttle_max: float, starting_max: float, steps: int, defaults: Tuple[float, float]):
+    throttle, starting_throttle = np.meshgrid(np.linspace(0.0, throttle_max, steps), np.linspace(0.0, starting_max, steps))
+    return np.append(throttle.ravel(), defaults[0]), np.append(starting_throttle.ravel(), defaults[1])
+
+def momentum_grid(scaling_max: float, decay_min: float, steps: int, defaults: Tuple[float, float]):
+    scaling, decay = np.meshgrid(np.linspace(0.5, scaling_max, steps), np.linspace(decay_min, 0.995, steps))
+    return np.append(scaling.ravel(), defaults[0]), np.append(decay.ravel(), defaults[1])
+
+def table(title: str, columns: List[Tuple[str, np.ndarray, str]], order: np.ndarray, top: int) -> List[str]:
+    """Format the best configurations, the last configuration of every grid holds the current defaults"""
+    default_index = len(columns[0][1]) - 1
+    indices = [index for index in order[:top] if index != default_index] + [default_index]
+    rows = [title, "    " + " ".join(f"{name:>16}" for name, values, fmt in columns)]
+    for index in indices:
+        marker = "  * " if index == default_index else "    "
+        rows.append(marker + " ".join(f"{format(values[index], fmt):>16}" for name, values, fmt in columns))
+    return rows
+
+def verify_throttler(hummingbird2, noises: List[NoiseEvent], throttle: np.ndarray, starting_throttle: np.ndarray, result: dict,
+    tap_max: float, count: int, seed: int) -> float:
+    """Run the FlatThrottler class on random configurations of the grid and return the largest difference with the vectorized results"""
+    rng = random.Random(seed)
+    difference = 0.0
+    for index in rng.sample(range(len(throttle)), min(count, len(throttle))):
+        adapter = ThrottlerAdapter(hummingbird2.FlatThrottler(float(throttle[index]), float(starting_throttle[index])), hummingbird2.HummingEvent)
+        expected = evaluate_throttler(noises, adapter, 1, tap_max)
+        for key, values in expected.items():
+            difference = max(difference, abs(float(values[0]) - float(result[key][index])))
+    return difference
+
+def verify_momentum(power_momentum, events: List[MomentumEvent], scaling: np.ndarray, decay: np.ndarray, result: dict,
+    count: int, seed: int) -> float:
+    """Run the PowerMomentum class on random configurations of the grid and return the largest relative overshoot difference"""
+    rng = random.Random(seed)
+    difference = 0.0
+    for index in rng.sample(range(len(scaling)), min(count, len(scaling))):
+        instance = power_momentum.PowerMomentum()
+        instance.power_scaling = float(scaling[index])
+        instance.decay_rate = -math.log(float(decay[index])) / power_momentum.momentum_decay_interval
+        instance.set_momentum(0.1, 0.0)
+        adapter = MomentumAdapter(instance, power_momentum.idle_momentum)
+        expected = evaluate_momentum(events, adapter, 1, power_momentum.idle_momentum, power_momentum.momentum_decay_interval)
+        power_momentum.frame_scheduler.unsubscribe(instance.momentum_job)
+
+        if float(expected["stalls"][0]) != float(result["stalls"][index]):
+            return math.inf
+        overshoot = float(result["overshoot_ticks"][index])
+        difference = max(difference, abs(float(expected["overshoot_ticks"][0]) - overshoot) / max(overshoot, 1.0))
+    return difference
+
+def run(events: list, args):
+    talon = harness.talon()
+    hummingbird2 = harness.load("hummingbird2")
+    power_momentum = harness.load("power_momentum")
+
+    noises = hummingbird_noises(events)
+    if noises:
+        profile = hummingbird2.compile_profiles()[args.profile]
+        flat = getattr(profile.throttler, "throttler", profile.throttler)
+        throttle, starting_throttle = throttler_grid(args.throttle_max, args.starting_max, args.steps, (flat.throttle, flat.starting_throttle))
+
+        start = time.perf_counter()
+        result = evaluate_throttler(noises, FlatThrottlerGrid(throttle, starting_throttle), len(throttle), args.tap_max)
+        elapsed = time.perf_counter() - start
+        misfires = result["tap_misfires"] + result["hold_misfires"]
+        order = np.lexsort((result["start_latency_ms"], misfires))
+        print(f"Evaluated {len(throttle)} throttler configurations over {len(noises)} noise events in {elapsed:.2f}s")
+        for row in table(f"FlatThrottler, * marks the current {args.profile} profile", [
+            ("throttle", throttle, ".3f"),
+            ("starting", starting_throttle, ".3f"),
+            ("tap misfires", result["tap_misfires"], ".0f"),
+            ("hold misfires", result["hold_misfires"], ".0f"),
+            ("start ms", result["start_latency_ms"], ".1f"),
+            ("repeats/s", result["repeats_per_second"], ".1f"),
+        ], order, args.top):
+            print(row)
+        if args.verify > 0:
+            difference = verify_throttler(hummingbird2, noises, throttle, starting_throttle, result, args.tap_max, args.verify, args.seed)
+            print(f"Largest difference with FlatThrottler over {args.verify} configurations: {difference:.6f}")
+
+    momentum = momentum_events(events)
+    if momentum:
+        scaling, decay = momentum_grid(args.scaling_max, args.decay_min, args.steps, (2.0, power_momentum.momentum_decay))
+        idle = power_momentum.idle_momentum
+        interval = power_momentum.momentum_decay_interval
+
+        start = time.perf_counter()
+        result = evaluate_momentum(momentum, MomentumGrid(scaling, decay, interval), len(scaling), idle, interval)
+        elapsed = time.perf_counter() - start
+        order = np.lexsort((result["start_latency_ms"], result["overshoot_ticks"], result["stalls"]))
+        print(f"Evaluated {len(scaling)} momentum configurations over {len(momentum)} momentum events in {elapsed:.2f}s")
+        for row in table("PowerMomentum, * marks a power scaling of 2 with the current decay", [
+            ("power scaling", scaling, ".2f"),
+            ("decay", decay, ".4f"),
+            ("stalls", result["stalls"], ".0f"),
+            ("start ms", result["start_latency_ms"], ".1f"),
+            ("overshoot ticks", result["overshoot_ticks"], ".2f"),
+        ], order, args.top):
+            print(row)
+        if args.verify > 0:
+            difference = verify_momentum(power_momentum, momentum, scaling, decay, result, args.verify, args.seed)
+            print(f"Largest relative overshoot difference with PowerMomentum over {args.verify} configurations: {difference:.4f}")
+    talon.cron.reset()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate throttler and momentum parameters over recorded noise traces")
+    parser.add_argument("traces", nargs="*", help="Paths to JSONL traces")
+    parser.add_argument("--synthesize", type=float, default=0, help="Tune against a synthetic trace of this many seconds instead")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic trace and the verified configurations")
+    parser.add_argument("--profile", default="arrows", help="Hummingbird profile whose throttler is marked as the current setting")
+    parser.add_argument("--tap-max", type=float, default=0.15, help="Noises shorter than this many seconds are meant as discrete taps")
+    parser.add_argument("--throttle-max", type=float, default=0.2, help="Largest throttle in seconds of the grid")
+    parser.add_argument("--starting-max", type=float, default=0.4, help="Largest starting throttle in seconds of the grid")
+    parser.add_argument("--scaling-max", type=float, default=5.0, help="Largest power scaling of the grid")
+    parser.add_argument("--decay-min", type=float, default=0.95, help="Smallest momentum decay per frame of the grid")
+    parser.add_argument("--steps", type=int, default=60, help="Amount of values per parameter, the grids hold steps squared configurations")
+    parser.add_argument("--top", type=int, default=10, help="Amount of best configurations to show")
+    parser.add_argument("--verify", type=int, default=0, help="Check this many random configurations against the classes of the scripts")
+    args = parser.parse_args()
+
+    events = synthesize(args.synthesize, args.seed) if args.synthesize > 0 else []
+    for path in args.traces:
+        events.extend(load_trace(path))
+    if not events:
+        parser.error("Pass at least one trace or --synthesize")
+    run(events, args)
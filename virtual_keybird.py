@@ -1,7 +1,8 @@
-from talon import actions, cron, Context, Module, ctrl
-from typing import Callable, Tuple, TypedDict
-from dataclasses import dataclass, asdict
-from talon.screen import Screen, main_screen
+from talon import actions, cron, Context, Module, ctrl, ui
+from typing import Callable, Dict, List, Optional, Tuple, TypedDict
+from dataclasses import dataclass, field, fields
+from .noise_latency import noise_latency
+import bisect
 
 @dataclass
 class GridKeys:
@@ -15,6 +16,33 @@ class GridKeys:
     bottommiddle: Callable[[float], None]
     bottomright: Callable[[float], None]
 
+@dataclass
+class KeyGrid:
+    """Grid of keys spread evenly over a screen, the keys are listed row by row"""
+    columns: int
+    rows: int
+    keys: List[Callable[[float], None]]
+
+    # Index of the screen in ui.screens(), or None to repeat the grid on every screen
+    screen: Optional[int] = None
+
+@dataclass
+class KeyRegion:
+    """Named rectangle on a screen that overrides the grid below it, given in fractions of the screen size"""
+    name: str
+    key: Callable[[float], None]
+    x: float
+    y: float
+    width: float
+    height: float
+    screen: int = 0
+
+@dataclass
+class KeybirdLayout:
+    """Grids and regions of a virtual keyboard, regions listed later are placed on top of earlier ones"""
+    grids: List[KeyGrid]
+    regions: List[KeyRegion] = field(default_factory=list)
+
 def noop_key(ts: float):
     pass
 
@@ -23,47 +51,115 @@ def print_key(key: str):
 
 def action_key(action):
     return lambda ts: action()
-    
+
 def keypress_key(key):
     return lambda ts: actions.key(key)
 
+def grid_layout(kb: GridKeys) -> KeybirdLayout:
+    return KeybirdLayout([KeyGrid(3, 3, [getattr(kb, key.name) for key in fields(kb)])])
+
+def screen_geometry() -> Tuple[Tuple[float, float, float, float], ...]:
+    return tuple((screen.x, screen.y, screen.width, screen.height) for screen in ui.screens())
+
+class KeyLookup:
+    """Precomputed lookup of the key under a position for a layout on a specific screen geometry
+
+    The edges of every grid cell and region split the desktop into a table of cells, which are found by bisecting both axes
+    """
+    x_edges: List[float]
+    y_edges: List[float]
+    cells: List[Callable[[float], None]]
+
+    def __init__(self, layout: KeybirdLayout, geometry: Tuple[Tuple[float, float, float, float], ...]):
+        # Rectangles of ( left, top, right, bottom, key ) in the order they are painted
+        rectangles = []
+        for grid in layout.grids:
+            for screen_index, (screen_x, screen_y, width, height) in enumerate(geometry):
+                if grid.screen is not None and grid.screen != screen_index:
+                    continue
+
+                # Both edges of a cell are computed from its index, so neighbouring cells share the exact same edge
+                for index, key in enumerate(grid.keys[:grid.columns * grid.rows]):
+                    column = index % grid.columns
+                    row = index // grid.columns
+                    rectangles.append((
+                        screen_x + column * width / grid.columns,
+                        screen_y + row * height / grid.rows,
+                        screen_x + ( column + 1 ) * width / grid.columns,
+                        screen_y + ( row + 1 ) * height / grid.rows,
+                        key
+                    ))
+        for region in layout.regions:
+            if region.screen < len(geometry):
+                screen_x, screen_y, width, height = geometry[region.screen]
+                left = screen_x + region.x * width
+                top = screen_y + region.y * height
+                rectangles.append((left, top, left + region.width * width, top + region.height * height, region.key))
+
+        self.x_edges = sorted({edge for rectangle in rectangles for edge in (rectangle[0], rectangle[2])})
+        self.y_edges = sorted({edge for rectangle in rectangles for edge in (rectangle[1], rectangle[3])})
+        self.columns = max(0, len(self.x_edges) - 1)
+        self.cells = [noop_key] * ( self.columns * max(0, len(self.y_edges) - 1) )
+        for left, top, right, bottom, key in rectangles:
+            first_column = bisect.bisect_left(self.x_edges, left)
+            last_column = bisect.bisect_left(self.x_edges, right)
+            for row in range(bisect.bisect_left(self.y_edges, top), bisect.bisect_left(self.y_edges, bottom)):
+                offset = row * self.columns
+                for column in range(first_column, last_column):
+                    self.cells[offset + column] = key
+
+    def find_key(self, x: float, y: float) -> Callable[[float], None]:
+        column = bisect.bisect_right(self.x_edges, x) - 1
+        row = bisect.bisect_right(self.y_edges, y) - 1
+        if column < 0 or row < 0 or column >= self.columns or row >= len(self.y_edges) - 1:
+            return noop_key
+        return self.cells[row * self.columns + column]
+
 class VirtualKeybird:
-    screen: Screen
-    
+    layout: KeybirdLayout
+
+    # Rebuilt lazily after the layout or the screen geometry has changed
+    lookup: Optional[KeyLookup] = None
+    geometry: Tuple[Tuple[float, float, float, float], ...] = ()
+
     def __init__(self):
-        keyboard = GridKeys(
+        self.set_keyboard(GridKeys(
             noop_key, noop_key, noop_key,
             noop_key, noop_key, noop_key,
             noop_key, noop_key, noop_key
-        )
-        self.screen = main_screen()
-        self.keyboard = asdict(keyboard)
+        ))
 
     def press(self, ts: float):
         """Press one of the defined keys """
         key_cb = self.find_key(ctrl.mouse_pos())
         key_cb(ts)
-        
+        if noise_latency.enabled:
+            noise_latency.record("virtual_keybird_dispatch", "", ts)
+
     def find_key(self, coord: Tuple[int, int]):
         """Find the key to press based on the given screen position"""
-        width = self.screen.width
-        height = self.screen.height
-        segment_width = width / 3
-        segment_height = height / 3
-        
-        x = "left"
-        y = "top"
-        if coord[0] > segment_width:
-            x = "middle" if coord[0] < segment_width * 2 else "right"
-        if coord[1] > segment_height:
-            y = "center" if coord[1] < segment_height * 2 else "bottom"
-        return self.keyboard[y+x]
+        lookup = self.lookup
+        if lookup is None:
+            self.geometry = screen_geometry()
+            lookup = self.lookup = KeyLookup(self.layout, self.geometry)
+        return lookup.find_key(coord[0], coord[1])
+
+    def screen_changed(self, *args):
+        if screen_geometry() != self.geometry:
+            self.lookup = None
 
     def set_keyboard(self, kb: GridKeys):
         """Set the current keyboard"""
-        self.keyboard = asdict(kb)
-        
+        self.set_layout(grid_layout(kb))
+
+    def set_layout(self, layout: KeybirdLayout):
+        """Set the current layout of grids and regions"""
+        self.layout = layout
+        self.lookup = None
+
 vkb = VirtualKeybird()
+ui.register("screen_change", vkb.screen_changed)
+
 debug_keyboard = GridKeys(
     print_key("topleft"), print_key("topmiddle"), print_key("topright"),
     print_key("centerleft"), print_key("centermiddle"), print_key("centerright"),
@@ -81,8 +177,10 @@ ctx = Context()
 mod = Module()
 @mod.action_class
 class Actions:
-                
+
     def press_virtual_keybird_key(ts: float):
         """Activate the actoin related to the virtual keyboard key mapped on the main screen"""
         global vkb
-        vkb.press(ts)
\ No newline at end of file
+        if noise_latency.enabled:
+            noise_latency.record("press_virtual_keybird_key", "", ts)
+        vkb.press(ts)
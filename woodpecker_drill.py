@@ -1,51 +1,130 @@
-from talon import actions, Context, Module, ctrl
-from typing import Callable
+from talon import actions, cron, Context, Module, ctrl
+from typing import Callable, List
+import bisect
+import math
+from .clock import now
+from .noise_recorder import noise_recorder
+from .noise_latency import noise_latency
+
+class RepeatSchedule:
+    """Schedule of how many actions are owed after a noise has been held for a while
+    
+    One action is owed at the start, one more after each of the breakpoints
+    And after the steady state start one more for every steady state interval
+    """
+    breakpoints_ms: List[float]
+    steady_start_ms: float
+    steady_interval_ms: float
+    steady_count: int
+    
+    def __init__(self, breakpoints_ms: List[float], steady_start_ms: float, steady_interval_ms: float):
+        self.breakpoints_ms = sorted(breakpoints_ms)
+        self.steady_start_ms = steady_start_ms
+        self.steady_interval_ms = steady_interval_ms
+        self.steady_count = 1 + len([breakpoint for breakpoint in self.breakpoints_ms if breakpoint < steady_start_ms])
+        
+    def owed(self, duration_ms: float) -> int:
+        """Total amount of actions owed after the given duration, including the one at the start"""
+        if duration_ms >= self.steady_start_ms:
+            return self.steady_count + int(( duration_ms - self.steady_start_ms ) // self.steady_interval_ms)
+        return 1 + bisect.bisect_left(self.breakpoints_ms, duration_ms)
+        
+    def next_due_ms(self, count: int) -> float:
+        """Duration in milliseconds after which more than the given amount of actions are owed"""
+        if count < self.steady_count:
+            return self.breakpoints_ms[count - 1] if count > 0 else 0.0
+        return self.steady_start_ms + ( count - self.steady_count + 1 ) * self.steady_interval_ms
+
+# Tapered schedule that allows a skilled user to time the amount of repeats
+# Repeats after 200, 350 and 500 milliseconds, and then every 50 milliseconds after a second
+woodpecker_schedule = RepeatSchedule([200, 350, 500], 1000, 50)
 
 class NoiseActionRepeater:
     starting_ts: float = 0.0
     count: int = 0
-    cb: Callable[[float], None]
+    cb: Callable[[float, int], None]
+    schedule: RepeatSchedule
     
-    def __init__(self):
-        self.cb = lambda ts: None
+    def __init__(self, schedule: RepeatSchedule = woodpecker_schedule):
+        self.cb = lambda ts, count: None
+        self.schedule = schedule
     
     def set_callback(self, cb: Callable):
+        """Set the callback that receives the timestamp and the amount of actions to perform"""
         self.cb = cb
         
+    def repeat(self, ts: float, count: int):
+        self.cb(ts, count)
+        if noise_latency.enabled:
+            noise_latency.record("woodpecker_dispatch", "", ts)
+        
     def start_drill(self, ts: float):
         self.starting_ts = ts
         self.count = 1
-        self.cb(ts)
+        self.repeat(ts, 1)
         
     def drill_update(self, ts: float):
-        """Triggers at specific time slots to allow a skilled user to time the amount of repeats"""
-        duration_ms = ( ts - self.starting_ts ) * 1000
-        if duration_ms < 200 and self.count <= 1:
-            pass
-        elif duration_ms > 200 and duration_ms < 350 and self.count <= 1:
-            self.cb(ts)
-            self.count += 1
-        elif duration_ms > 350 and duration_ms < 500 and self.count <= 2:
-            self.cb(ts)
-            self.count += 1
-        elif duration_ms > 500 and duration_ms < 700 and self.count <= 3:
-            self.cb(ts)
-            self.count += 1
-        elif duration_ms > 700 and duration_ms < 900 and self.count <= 3:
-            self.cb(ts)
-            self.count += 1
-        elif duration_ms > 1000:
-            expected_count = 4 + ( ( duration_ms - 1000 ) / 50 )
-            if expected_count != self.count:
-                self.cb(ts)
-                self.count += 1
+        """Performs all the actions owed since the last update in a single batch"""
+        if self.count == 0:
+            return
+        
+        owed = self.schedule.owed(( ts - self.starting_ts ) * 1000)
+        if owed > self.count:
+            count = owed - self.count
+            self.count = owed
+            self.repeat(ts, count)
         
     def stop_drill(self, ts: float):
         self.starting_ts = 0.0
         self.count = 0
 
-actionRepeater = NoiseActionRepeater()
-actionRepeater.set_callback(lambda x: actions.core.repeat_command(1))
+class TimedNoiseActionRepeater(NoiseActionRepeater):
+    """Repeater that performs the actions on its own timeline instead of waiting for repeat events
+    
+    Every timer is scheduled from the starting timestamp, so lateness of one timer does not push back the next ones
+    Repeat events only act as keep-alives, the drill stops when they have not been received for a while
+    """
+    job = None
+    last_keep_alive: float = 0.0
+    keep_alive_timeout: float = 0.3
+    
+    def start_drill(self, ts: float):
+        cron.cancel(self.job)
+        super().start_drill(ts)
+        self.last_keep_alive = now()
+        self.schedule_next()
+        
+    def drill_update(self, ts: float):
+        self.last_keep_alive = now()
+        
+    def stop_drill(self, ts: float):
+        cron.cancel(self.job)
+        self.job = None
+        super().stop_drill(ts)
+        
+    def schedule_next(self):
+        due_ts = self.starting_ts + self.schedule.next_due_ms(self.count) / 1000
+        # Actions are owed strictly after their due time, so the timer always waits at least a millisecond
+        delay_ms = max(1, math.ceil(( due_ts - now() ) * 1000))
+        self.job = cron.after(f"{delay_ms}ms", self.timer_fired)
+        
+    def timer_fired(self):
+        self.job = None
+        if self.count == 0:
+            return
+        
+        ts = now()
+        if ts - self.last_keep_alive > self.keep_alive_timeout:
+            self.stop_drill(ts)
+        else:
+            super().drill_update(ts)
+            self.schedule_next()
+
+event_repeater = NoiseActionRepeater()
+timed_repeater = TimedNoiseActionRepeater()
+event_repeater.set_callback(lambda ts, count: actions.core.repeat_command(count))
+timed_repeater.set_callback(lambda ts, count: actions.core.repeat_command(count))
+actionRepeater = event_repeater
 
 ctx = Context()
 mod = Module()
@@ -54,12 +133,26 @@ class Actions:
 
     def woodpecker_start(ts: float):
         """Starts the tapered action repeater"""
+        noise_recorder.record("woodpecker_start", ts)
+        if noise_latency.enabled:
+            noise_latency.record("woodpecker_start", "", ts)
         actionRepeater.start_drill(ts)
         
     def woodpecker_drill(ts: float):
         """Updates the tapered action repeater with a timestamp which possibly triggers the action"""
+        noise_recorder.record("woodpecker_drill", ts)
+        if noise_latency.enabled:
+            noise_latency.record("woodpecker_drill", "", ts)
         actionRepeater.drill_update(ts)
         
+    def woodpecker_timed(timed: bool = True):
+        """Switch between repeating on a timer and repeating on the repeat events of the noise"""
+        noise_recorder.record("woodpecker_timed", timed)
+        global actionRepeater
+        actionRepeater.stop_drill(0.0)
+        actionRepeater = timed_repeater if timed else event_repeater
+        
     def woodpecker_stop(ts: float):
         """Stops drilling"""
+        noise_recorder.record("woodpecker_stop", ts)
         actionRepeater.stop_drill(ts)
\ No newline at end of file